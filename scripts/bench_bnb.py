@@ -0,0 +1,43 @@
+'''
+Compare the branch and bound searches on the same instances.
+
+Reports the cost found, the explored nodes, the peak number of nodes kept in memory and the throughput,
+with and without the greedy incumbent the searches start from.
+'''
+import pandas as pd
+
+from utils.expt_tools import execute_bin
+
+
+def main():
+    rows = []
+    for search in ['best_first', 'dfs']:
+        for greedy_seed in [False, True]:
+            for roi_ratio in [2, 4, 8]:
+                settings = {'transformer': 'fast_continuous',
+                            'optimizer': 'bnb',
+                            'search': search,
+                            'greedy_seed': greedy_seed,
+                            'completion_interval': 1000 if greedy_seed else 0,
+                            'roi_type': 'rect(x)',
+                            'roi_ratio': roi_ratio,
+                            'num_rois': 10,
+                            'archive_size': 15000,
+                            'target_coverage': 0.9}
+                for report in execute_bin(settings):
+                    optimization = report['optimization']
+                    rows.append({'search': search,
+                                 'greedy_seed': greedy_seed,
+                                 'roi_ratio': roi_ratio,
+                                 'cost': optimization['cost'],
+                                 'number_of_explored_nodes': optimization['number_of_explored_nodes'],
+                                 'peak_number_of_nodes': optimization['peak_number_of_nodes'],
+                                 'nodes_per_second': optimization['nodes_per_second'],
+                                 'time_to_first_incumbent': optimization['time_to_first_incumbent'],
+                                 'optimization.time': optimization['time']})
+    df = pd.DataFrame(rows)
+    print(df.groupby(['search', 'greedy_seed', 'roi_ratio']).mean())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''
+Compare the bounds of the branch and bound on the same instances.
+
+Reports the explored nodes and the time of each search with the claims bound and with the LP bound by dual ascent.
+The cost found should be the same.
+'''
+import pandas as pd
+
+from utils.expt_tools import execute_bin
+
+
+def main():
+    rows = []
+    for search in ['best_first', 'dfs']:
+        for bound in ['claims', 'lp']:
+            for roi_ratio in [4, 8, 16]:
+                settings = {'transformer': 'fast_continuous',
+                            'optimizer': 'bnb',
+                            'search': search,
+                            'bound': bound,
+                            'roi_type': 'rect(x)',
+                            'roi_ratio': roi_ratio,
+                            'num_rois': 10,
+                            'archive_size': 15000,
+                            'target_coverage': 0.9}
+                for roi, report in enumerate(execute_bin(settings)):
+                    optimization = report['optimization']
+                    rows.append({'search': search,
+                                 'bound': bound,
+                                 'roi_ratio': roi_ratio,
+                                 'roi': roi,
+                                 'cost': optimization['cost'],
+                                 'number_of_explored_nodes': optimization['number_of_explored_nodes'],
+                                 'optimization.time': optimization['time']})
+    df = pd.DataFrame(rows)
+    print(df.groupby(['search', 'bound', 'roi_ratio']).mean())
+
+    costs = df.pivot_table(index=['search', 'roi_ratio', 'roi'], columns='bound', values='cost')
+    print('instances with different costs:', (costs['claims'] != costs['lp']).sum())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+Speedup curve of the parallel best-first branch and bound.
+
+Runs the same hard instances with 1 to N worker threads and prints the wall time of the search
+relative to the single threaded run. The instances that time out are reported but not counted in the speedup.
+'''
+import os
+
+import pandas as pd
+
+from utils.expt_tools import execute_bin
+
+
+def thread_counts():
+    counts = [1]
+    while counts[-1] * 2 <= os.cpu_count():
+        counts.append(counts[-1] * 2)
+    if counts[-1] != os.cpu_count():
+        counts.append(os.cpu_count())
+    return counts
+
+
+def main():
+    rows = []
+    for threads in thread_counts():
+        settings = {'transformer': 'fast_continuous',
+                    'optimizer': 'bnb',
+                    'threads': threads,
+                    'roi_type': 'rect(x)',
+                    'roi_ratio': 16,
+                    'num_rois': 5,
+                    'archive_size': 15000,
+                    'target_coverage': 0.9}
+        for roi, report in enumerate(execute_bin(settings)):
+            optimization = report['optimization']
+            rows.append({'threads': threads,
+                         'roi': roi,
+                         'timed_out': optimization.get('timed_out', False),
+                         'number_of_explored_nodes': optimization['number_of_explored_nodes'],
+                         'wall_time': optimization['wall_time']})
+    df = pd.DataFrame(rows)
+    print('timed out:')
+    print(df.groupby('threads')['timed_out'].sum())
+
+    solved = df.groupby('roi')['timed_out'].transform('sum') == 0
+    times = df[solved].pivot(index='roi', columns='threads', values='wall_time')
+    speedup = times.rdiv(times[1], axis=0)
+    print('speedup over 1 thread:')
+    print(speedup.mean())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''
+Time the discrete transformer with and without the raster cache.
+
+The cache is run twice, the first run fills the file next to the archive and the second one reads it.
+The cells should be the same in every run.
+'''
+import os
+
+import pandas as pd
+
+from utils.expt_tools import execute_bin
+from utils.path import data_dir
+
+
+def main():
+    delta = 0.01
+    cache_path = data_dir(['products', 'archive_{}.cells'.format(delta)])
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    rows = []
+    for run in ['no cache', 'cold cache', 'warm cache']:
+        for roi_ratio in [2, 4, 8, 16]:
+            settings = {'transformer': 'discrete',
+                        'optimizer': 'none',
+                        'delta': delta,
+                        'raster_cache': run != 'no cache',
+                        'roi_type': 'rect(x)',
+                        'roi_ratio': roi_ratio,
+                        'num_rois': 20,
+                        'archive_size': 15000,
+                        'target_coverage': 0.9}
+            for roi, report in enumerate(execute_bin(settings)):
+                transformation = report['transformation']
+                cache = transformation.get('raster_cache', {})
+                rows.append({'run': run,
+                             'roi_ratio': roi_ratio,
+                             'roi': roi,
+                             'number_of_cells': report['number_of_cells'],
+                             'transformation.time': transformation['time'],
+                             'hit_rate': cache.get('hit_rate'),
+                             'disk_bytes': cache.get('disk_bytes')})
+    df = pd.DataFrame(rows)
+    print(df.groupby(['run', 'roi_ratio']).mean())
+
+    cells = df.pivot_table(index=['roi_ratio', 'roi'], columns='run', values='number_of_cells')
+    print('rois with different cells:', (cells.nunique(axis=1) > 1).sum())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+'''
+Time the transformers on the 15000-scene archive.
+
+Run it on two builds to compare them, e.g. build the old commit, run
+`python bench_transformation.py > before.txt`, build the new one and run it again.
+'''
+import pandas as pd
+
+from utils.expt_tools import execute_bin
+
+
+def main():
+    rows = []
+    for transformer in ['continuous', 'fast_continuous', 'discrete', 'quadtree', 'hybrid', 'sampling']:
+        for roi_ratio in [16, 40]:
+            settings = {'transformer': transformer,
+                        'optimizer': 'none',
+                        'delta': 0.005,
+                        'roi_type': 'rect(x)',
+                        'roi_ratio': roi_ratio,
+                        'num_rois': 10,
+                        'archive_size': 15000,
+                        'target_coverage': 0.9}
+            for report in execute_bin(settings):
+                rows.append({'transformer': transformer,
+                             'roi_ratio': roi_ratio,
+                             'number_of_cells': report['number_of_cells'],
+                             'transformation.time': report['transformation']['time']})
+    df = pd.DataFrame(rows)
+    print(df.groupby(['transformer', 'roi_ratio']).mean())
+
+
+if __name__ == '__main__':
+    main()
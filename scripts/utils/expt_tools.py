@@ -27,9 +27,9 @@ def execute_bin(settings):
 
     report = {}
     try:
-        with open(output_arg, 'r') as f:
+        with open(output_path, 'r') as f:
             report = json.load(f)
-        os.system("rm {}", output_path)
+        os.remove(output_path)
     except Exception as e:
         print(e)
     return report
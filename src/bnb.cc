@@ -0,0 +1,1139 @@
+#include "bnb.h"
+
+#include <algorithm>
+#include <atomic>
+#include <iostream>
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <queue>
+#include <thread>
+
+using namespace std;
+using nlohmann::json;
+
+Coverage::Coverage(int number_of_elements) : words((number_of_elements + 63) / 64, 0)
+{
+}
+
+void Coverage::rollback(int checkpoint)
+{
+    while (log.size() > checkpoint)
+    {
+        int element = log.back();
+        words[element >> 6] &= ~(uint64_t(1) << (element & 63));
+        log.pop_back();
+    }
+}
+
+BnbProblem::BnbProblem(const Universe &universe, const Ranges &ranges, double target_coverage)
+    : incidence(universe.incidence), ranges(ranges), target_value(universe.value * target_coverage)
+{
+    sort(this->ranges.begin(), this->ranges.end(), [](const Range &a, const Range &b) { // unit cost from lower to higher
+        return a.cost / a.value < b.cost / b.value;
+    });
+    int n = this->ranges.size();
+    unit_costs = func::map(this->ranges, [](const Range &range) {
+        return range.cost / range.value;
+    });
+    auto positions = vector<int>(incidence.number_of_ranges(), -1);
+    for (int p = 0; p < n; ++p)
+    {
+        positions[this->ranges[p].id] = p;
+    }
+
+    // the holders of an element in unit cost order give its claim at the root, and the next holder of each entry
+    claims.assign(n, 0);
+    next_holders.assign(incidence.range_elements.size(), -1);
+    holder_offsets.assign(incidence.number_of_elements() + 1, 0);
+    auto holders = vector<int>();
+    for (int element = 0; element < incidence.number_of_elements(); ++element)
+    {
+        holder_offsets[element + 1] = this->holders.size();
+        holders.clear();
+        for (auto range_id : incidence.ranges_of(element))
+        {
+            if (positions[range_id] >= 0)
+            {
+                holders.push_back(positions[range_id]);
+            }
+        }
+        if (holders.empty())
+        {
+            continue;
+        }
+        sort(holders.begin(), holders.end());
+        this->holders.insert(this->holders.end(), holders.begin(), holders.end());
+        holder_offsets[element + 1] = this->holders.size();
+        claims[holders.front()] += incidence.values[element];
+        for (int i = 0; i + 1 < holders.size(); ++i)
+        {
+            auto row = incidence.elements_of(this->ranges[holders[i]].id);
+            int entry = lower_bound(row.begin(), row.end(), element) - incidence.range_elements.data();
+            next_holders[entry] = holders[i + 1];
+        }
+    }
+
+    suffix_values.assign(n + 1, 0);
+    auto covered = vector<bool>(incidence.number_of_elements(), false);
+    for (int p = n - 1; p >= 0; --p)
+    {
+        suffix_values[p] = suffix_values[p + 1];
+        for (auto element : incidence.elements_of(this->ranges[p].id))
+        {
+            if (!covered[element])
+            {
+                covered[element] = true;
+                suffix_values[p] += incidence.values[element];
+            }
+        }
+    }
+}
+
+double BnbProblem::select(int cursor, Coverage &coverage) const
+{
+    double value = 0;
+    for (auto element : incidence.elements_of(ranges[cursor].id))
+    {
+        if (!coverage.test(element))
+        {
+            coverage.set(element);
+            value += incidence.values[element];
+        }
+    }
+    return value;
+}
+
+double BnbProblem::bound(int cursor, double cost, double value, Coverage &coverage) const
+{
+    // fill the deficit with the cheapest uncovered elements, each costs the unit cost of its range
+    int checkpoint = coverage.checkpoint();
+    double cost_lower_bound = cost;
+    double current_value = value;
+    bool reached = false;
+    for (int i = cursor; i < ranges.size() && !reached; ++i)
+    {
+        for (auto element : incidence.elements_of(ranges[i].id)) // k
+        {
+            if (!coverage.test(element))
+            {
+                double element_value = incidence.values[element];
+                double deficit = target_value - current_value;
+                if (element_value > deficit)
+                {
+                    cost_lower_bound += unit_costs[i] * deficit;
+                    current_value += deficit;
+                    reached = true;
+                    break;
+                }
+                cost_lower_bound += unit_costs[i] * element_value;
+                current_value += element_value;
+                coverage.set(element);
+            }
+        }
+    }
+    coverage.rollback(checkpoint);
+    if (!reached && current_value < target_value)
+    {
+        return numeric_limits<double>::max();
+    }
+    return cost_lower_bound;
+}
+
+SearchState::SearchState(const BnbProblem &problem)
+    : problem(problem), coverage(problem.incidence.number_of_elements()), claims(problem.claims)
+{
+}
+
+double SearchState::select()
+{
+    // the uncovered elements of the range are all claimed by it
+    double gained = problem.select(cursor, coverage);
+    set_claim(cursor, 0);
+    value += gained;
+    ++cursor;
+    return gained;
+}
+
+void SearchState::drop()
+{
+    // the uncovered elements of the range are claimed by their next holders
+    const auto &incidence = problem.incidence;
+    int range_id = problem.ranges[cursor].id;
+    for (int entry = incidence.range_offsets[range_id]; entry < incidence.range_offsets[range_id + 1]; ++entry)
+    {
+        int element = incidence.range_elements[entry];
+        int next_holder = problem.next_holders[entry];
+        if (next_holder >= 0 && !coverage.test(element))
+        {
+            set_claim(next_holder, claims[next_holder] + incidence.values[element]);
+        }
+    }
+    set_claim(cursor, 0);
+    ++cursor;
+}
+
+double SearchState::bound(double cost) const
+{
+    // fill the deficit with the cheapest claims, each costs the unit cost of its range
+    double cost_lower_bound = cost;
+    double deficit = problem.target_value - value;
+    for (int p = cursor; p < claims.size(); ++p)
+    {
+        if (claims[p] <= 0)
+        {
+            continue;
+        }
+        if (claims[p] > deficit)
+        {
+            return cost_lower_bound + problem.unit_costs[p] * deficit;
+        }
+        cost_lower_bound += problem.unit_costs[p] * claims[p];
+        deficit -= claims[p];
+    }
+    if (deficit > 0)
+    {
+        return numeric_limits<double>::max();
+    }
+    return cost_lower_bound;
+}
+
+void SearchState::rollback(const Checkpoint &checkpoint)
+{
+    cursor = checkpoint.cursor;
+    value = checkpoint.value;
+    coverage.rollback(checkpoint.coverage);
+    while (claims_log.size() > checkpoint.claims)
+    {
+        claims[claims_log.back().first] = claims_log.back().second;
+        claims_log.pop_back();
+    }
+}
+
+void SearchState::set_claim(int position, double claim)
+{
+    claims_log.emplace_back(position, claims[position]);
+    claims[position] = claim;
+}
+
+DualAscent::DualAscent(const BnbProblem &problem)
+    : problem(problem), slacks(problem.ranges.size()), seen(problem.incidence.number_of_elements(), -1)
+{
+    // every element priced at the lowest unit cost of its holders is feasible, it is the bound at the root
+    prices.assign(problem.incidence.number_of_elements(), numeric_limits<double>::max());
+    for (int element = 0; element < prices.size(); ++element)
+    {
+        if (problem.holder_offsets[element] != problem.holder_offsets[element + 1])
+        {
+            prices[element] = problem.unit_costs[problem.holders[problem.holder_offsets[element]]];
+        }
+    }
+}
+
+double DualAscent::fill(double deficit, int &filled) const
+{
+    // candidates are sorted by price
+    const auto &values = problem.incidence.values;
+    double cost = 0;
+    for (filled = 0; filled < candidates.size() && deficit > 0; ++filled)
+    {
+        int element = candidates[filled];
+        double bought = min(values[element], deficit);
+        cost += prices[element] * bought;
+        deficit -= bought;
+    }
+    return deficit > 0 ? numeric_limits<double>::max() : cost;
+}
+
+double DualAscent::bound(int cursor, double cost, double value, const Coverage &coverage)
+{
+    const double step = 0.05; // of the price level, relative
+    const int rounds = 10;
+    const auto &incidence = problem.incidence;
+    double deficit = problem.target_value - value;
+    if (deficit <= 0)
+    {
+        return cost;
+    }
+
+    ++number_of_bounds;
+    candidates.clear();
+    for (int p = cursor; p < problem.ranges.size(); ++p)
+    {
+        slacks[p] = problem.ranges[p].cost;
+        for (auto element : incidence.elements_of(problem.ranges[p].id))
+        {
+            if (!coverage.test(element))
+            {
+                slacks[p] -= prices[element] * incidence.values[element];
+                if (seen[element] != number_of_bounds)
+                {
+                    seen[element] = number_of_bounds;
+                    candidates.push_back(element);
+                }
+            }
+        }
+    }
+
+    auto by_price = [&](int a, int b) { return prices[a] < prices[b]; };
+    sort(candidates.begin(), candidates.end(), by_price);
+    int filled = 0;
+    double bought = fill(deficit, filled);
+    if (bought == numeric_limits<double>::max())
+    {
+        return bought;
+    }
+
+    // raise the cheap elements, in price order, towards a level above the price of the last element bought.
+    // The level goes up as long as the deficit costs more at the raised prices
+    double level = prices[candidates[filled - 1]];
+    auto previous_slacks = vector<double>();
+    for (int round = 0; round < rounds; ++round)
+    {
+        level *= 1 + step;
+        int checkpoint = log.size();
+        previous_slacks.assign(slacks.begin() + cursor, slacks.end());
+        for (auto element : candidates)
+        {
+            if (prices[element] >= level)
+            {
+                break;
+            }
+            double element_value = incidence.values[element];
+            double raise = level - prices[element];
+            for (int h = problem.holder_offsets[element]; h < problem.holder_offsets[element + 1]; ++h)
+            {
+                if (problem.holders[h] >= cursor)
+                {
+                    raise = min(raise, max(slacks[problem.holders[h]], 0.0) / element_value);
+                }
+            }
+            if (raise > 0)
+            {
+                log.emplace_back(element, prices[element]);
+                prices[element] += raise;
+                for (int h = problem.holder_offsets[element]; h < problem.holder_offsets[element + 1]; ++h)
+                {
+                    if (problem.holders[h] >= cursor)
+                    {
+                        slacks[problem.holders[h]] -= raise * element_value;
+                    }
+                }
+            }
+        }
+        sort(candidates.begin(), candidates.end(), by_price);
+        double raised = fill(deficit, filled);
+        if (raised <= bought) // the slack went to elements not bought, back to the previous level
+        {
+            rollback(checkpoint);
+            copy(previous_slacks.begin(), previous_slacks.end(), slacks.begin() + cursor);
+            break;
+        }
+        bought = raised;
+    }
+    return cost + bought;
+}
+
+void DualAscent::rollback(int checkpoint)
+{
+    while (log.size() > checkpoint)
+    {
+        prices[log.back().first] = log.back().second;
+        log.pop_back();
+    }
+}
+
+double greedy_completion(const BnbProblem &problem, const Coverage &coverage, int cursor, double value, vector<int> &added)
+{
+    // lazy greedy, the value of a candidate is re-evaluated when it is popped since values only decrease
+    struct Candidate
+    {
+        double ratio;
+        int position;
+        double value;
+        bool operator>(const Candidate &other) const
+        {
+            return ratio > other.ratio || (ratio == other.ratio && position > other.position);
+        }
+    };
+    const auto &incidence = problem.incidence;
+    auto completed = Coverage(incidence.number_of_elements()); // covered by the completion
+    auto uncovered_value = [&](int position) {
+        double uncovered = 0;
+        for (auto element : incidence.elements_of(problem.ranges[position].id))
+        {
+            if (!coverage.test(element) && !completed.test(element))
+            {
+                uncovered += incidence.values[element];
+            }
+        }
+        return uncovered;
+    };
+
+    auto candidates = priority_queue<Candidate, vector<Candidate>, greater<Candidate>>();
+    for (int p = cursor; p < problem.ranges.size(); ++p)
+    {
+        double uncovered = uncovered_value(p);
+        if (uncovered > 0)
+        {
+            candidates.push(Candidate{problem.ranges[p].cost / uncovered, p, uncovered});
+        }
+    }
+    double cost = 0;
+    added.clear();
+    while (value < problem.target_value && !candidates.empty())
+    {
+        auto candidate = candidates.top();
+        candidates.pop();
+        double uncovered = uncovered_value(candidate.position);
+        if (uncovered != candidate.value)
+        {
+            if (uncovered > 0)
+            {
+                candidates.push(Candidate{problem.ranges[candidate.position].cost / uncovered, candidate.position, uncovered});
+            }
+            continue;
+        }
+        added.push_back(candidate.position);
+        cost += problem.ranges[candidate.position].cost;
+        value += uncovered;
+        for (auto element : incidence.elements_of(problem.ranges[candidate.position].id))
+        {
+            if (!coverage.test(element) && !completed.test(element))
+            {
+                completed.set(element);
+            }
+        }
+    }
+    if (value < problem.target_value)
+    {
+        added.clear();
+        return numeric_limits<double>::max();
+    }
+    sort(added.begin(), added.end());
+    return cost;
+}
+
+namespace
+{
+// A node only keeps its decision, the coverage is rebuilt from the chain of parents when the node is expanded
+struct SearchNode
+{
+    SearchNode(shared_ptr<const SearchNode> parent, int cursor, bool selected, double cost, double value, atomic<int> &live_nodes)
+        : parent(move(parent)), cursor(cursor), selected(selected), cost(cost), value(value), live_nodes(live_nodes)
+    {
+        ++live_nodes;
+    }
+    ~SearchNode() { --live_nodes; }
+
+    shared_ptr<const SearchNode> parent; // null for the root
+    int cursor;                          // ranges before the cursor are decided
+    bool selected;                       // the decision on ranges[cursor - 1]
+    double cost;                         // the cost of selected ranges
+    double value;                        // current covered area
+    double cost_lower_bound = 0;
+    atomic<int> &live_nodes;
+};
+
+struct ByLowerBound
+{
+    bool operator()(const shared_ptr<const SearchNode> &a, const shared_ptr<const SearchNode> &b) const
+    {
+        return a->cost_lower_bound > b->cost_lower_bound; // to make it a min heap
+    }
+};
+
+void materialize(const SearchNode &node, const BnbProblem &problem, Coverage &coverage)
+{
+    coverage.rollback(0);
+    for (auto current = &node; current->parent != nullptr; current = current->parent.get())
+    {
+        if (current->selected)
+        {
+            problem.select(current->cursor - 1, coverage);
+        }
+    }
+}
+
+vector<int> selection_of(const SearchNode &node)
+{
+    auto selection = vector<int>();
+    for (auto current = &node; current->parent != nullptr; current = current->parent.get())
+    {
+        if (current->selected)
+        {
+            selection.push_back(current->cursor - 1);
+        }
+    }
+    reverse(selection.begin(), selection.end());
+    return selection;
+}
+
+// The cheapest selection found so far
+class Incumbent
+{
+public:
+  bool improve(double cost, vector<int> selection, double time)
+  {
+      if (cost >= this->cost)
+      {
+          return false;
+      }
+      if (this->cost == numeric_limits<double>::max())
+      {
+          time_to_first_incumbent = time;
+      }
+      this->cost = cost;
+      this->selection = move(selection);
+      return true;
+  }
+
+  void report(json &report) const
+  {
+      report["time_to_first_incumbent"] = time_to_first_incumbent >= 0 ? json(time_to_first_incumbent) : json(nullptr);
+  }
+
+  double cost = numeric_limits<double>::max();
+  vector<int> selection;
+
+private:
+  double time_to_first_incumbent = -1;
+};
+
+// the greedy solution is the first incumbent
+void seed(const BnbProblem &problem, const BnbOptions &options, Incumbent &incumbent, const WallStopwatch &sw)
+{
+    if (!options.greedy_seed)
+    {
+        return;
+    }
+    auto selection = vector<int>();
+    double cost = greedy_completion(problem, Coverage(problem.incidence.number_of_elements()), 0, 0, selection);
+    incumbent.improve(cost, move(selection), sw.lap());
+}
+
+// whether a greedy completion is due after the number of explored nodes
+bool completion_due(const BnbOptions &options, long long number_of_nodes)
+{
+    return options.completion_interval > 0 && number_of_nodes % options.completion_interval == 0;
+}
+
+// Lower bounds of the nodes given up on, pruned within the gap or still open at the deadline.
+// The cheapest of them proves how far the incumbent can be from the optimal.
+class OpenBounds
+{
+public:
+  void add(double bound)
+  {
+      double current = lower_bound.load();
+      while (bound < current && !lower_bound.compare_exchange_weak(current, bound))
+      {
+      }
+  }
+
+  void report(json &report, double best_cost) const
+  {
+      if (best_cost == numeric_limits<double>::max()) // no incumbent
+      {
+          return;
+      }
+      double proven_lower_bound = min(lower_bound.load(), best_cost);
+      report["lower_bound"] = proven_lower_bound;
+      report["gap"] = (best_cost - proven_lower_bound) / best_cost;
+  }
+
+private:
+  atomic<double> lower_bound{numeric_limits<double>::max()};
+};
+
+// whether a node may lead to a solution worth finding, the ones only pruned by the gap are remembered
+bool worth_exploring(double cost_lower_bound, double best_cost, const BnbOptions &options, OpenBounds &open_bounds)
+{
+    if (cost_lower_bound < best_cost * (1 - options.gap))
+    {
+        return true;
+    }
+    if (cost_lower_bound < best_cost)
+    {
+        open_bounds.add(cost_lower_bound);
+    }
+    return false;
+}
+
+void report_search(json &report, const string &search, long long number_of_nodes, int peak_number_of_nodes, double time)
+{
+    report["search"] = search;
+    report["number_of_explored_nodes"] = number_of_nodes;
+    report["peak_number_of_nodes"] = peak_number_of_nodes;
+    report["nodes_per_second"] = time > 0 ? number_of_nodes / time : 0;
+    report["wall_time"] = time; // the CPU time the solver reports adds up the workers
+}
+
+// The LP bound of the best-first searches. Nodes keep no prices, so the ascent of every node starts from the prices
+// of the root, which are feasible everywhere
+class RootDuals
+{
+public:
+  RootDuals(const BnbProblem &problem, const BnbOptions &options)
+      : options(options), duals(problem)
+  {
+      if (options.bound == "lp")
+      {
+          duals.bound(0, 0, 0, Coverage(problem.incidence.number_of_elements()));
+          root = duals.checkpoint();
+      }
+  }
+
+  // the bound of a node tightened by the LP relaxation, unless it is pruned already
+  double tighten(double cost_lower_bound, int cursor, double cost, double value, const Coverage &coverage, double best_cost)
+  {
+      if (options.bound != "lp" || cost_lower_bound >= best_cost * (1 - options.gap))
+      {
+          return cost_lower_bound;
+      }
+      double lp_bound = duals.bound(cursor, cost, value, coverage);
+      duals.rollback(root);
+      return max(cost_lower_bound, lp_bound);
+  }
+
+private:
+  const BnbOptions &options;
+  DualAscent duals;
+  int root = 0;
+};
+
+// the number of live nodes the best-first search can keep within options.memory_budget
+long long node_budget(const BnbOptions &options)
+{
+    if (options.memory_budget <= 0)
+    {
+        return numeric_limits<long long>::max();
+    }
+    // make_shared allocates a node with its control block, and the queue holds one more pointer to it
+    const double node_footprint = sizeof(SearchNode) + 2 * sizeof(shared_ptr<const SearchNode>) + 16;
+    return static_cast<long long>(options.memory_budget * 1024 * 1024 / node_footprint);
+}
+
+// Dives with a single state, the decisions are applied and undone in place. The incumbent and the open bounds belong
+// to the caller, so a best-first search can dive from its nodes.
+class DepthFirstSearch
+{
+public:
+  DepthFirstSearch(const BnbProblem &problem, const BnbOptions &options, Incumbent &incumbent, OpenBounds &open_bounds,
+                   const WallStopwatch &sw)
+      : problem(problem), options(options), state(problem), duals(problem), incumbent(incumbent),
+        open_bounds(open_bounds), sw(sw)
+  {
+  }
+
+  void explore_root()
+  {
+      double cost_lower_bound = state.bound(0);
+      if (worth_exploring(cost_lower_bound, incumbent.cost, options, open_bounds))
+      {
+          dive(0, cost_lower_bound);
+      }
+  }
+
+  // explores the subtree of a node, its decisions are replayed on the state first
+  void explore(const SearchNode &node)
+  {
+      auto path = vector<const SearchNode *>();
+      for (auto current = &node; current->parent != nullptr; current = current->parent.get())
+      {
+          path.push_back(current);
+      }
+      auto root = state.checkpoint();
+      for (auto current = path.rbegin(); current != path.rend(); ++current)
+      {
+          if ((*current)->selected)
+          {
+              selection.push_back(state.cursor);
+              state.select();
+          }
+          else
+          {
+              state.drop();
+          }
+      }
+      dive(node.cost, node.cost_lower_bound);
+      state.rollback(root);
+      selection.clear();
+  }
+
+  long long number_of_nodes = 0;
+  long long number_of_completions = 0;
+  int peak_number_of_nodes = 0; // the deepest dive
+  bool timed_out = false;
+
+private:
+  void dive(double cost, double cost_lower_bound)
+  {
+      ++number_of_nodes;
+      peak_number_of_nodes = max(peak_number_of_nodes, state.cursor + 1);
+      if (timed_out || (number_of_nodes % 1024 == 0 && sw.lap() > options.deadline))
+      {
+          // the nodes left on the way back are open
+          timed_out = true;
+          open_bounds.add(cost_lower_bound);
+          return;
+      }
+
+      if (state.value >= problem.target_value)
+      {
+          incumbent.improve(cost, selection, sw.lap()); // if lower cost, great
+          return;
+      }
+      int cursor = state.cursor;
+      if (cursor == problem.ranges.size())
+      {
+          return;
+      }
+      if (options.bound == "lp") // the prices of the node are raised from the ones of its parent
+      {
+          auto prices = duals.checkpoint();
+          double lp_bound = duals.bound(cursor, cost, state.value, state.covered());
+          if (!worth_exploring(lp_bound, incumbent.cost, options, open_bounds))
+          {
+              duals.rollback(prices);
+              return;
+          }
+          branch(cost);
+          duals.rollback(prices);
+      }
+      else
+      {
+          branch(cost);
+      }
+  }
+
+  void branch(double cost)
+  {
+      int cursor = state.cursor;
+      if (completion_due(options, number_of_nodes))
+      {
+          complete(cost);
+      }
+
+      auto checkpoint = state.checkpoint();
+      double select_cost = cost + problem.ranges[cursor].cost;
+      state.select();
+      double select_bound = state.bound(select_cost);
+      state.rollback(checkpoint);
+      double drop_bound = numeric_limits<double>::max();
+      if (problem.can_reach(cursor + 1, state.value))
+      {
+          state.drop();
+          drop_bound = state.bound(cost);
+          state.rollback(checkpoint);
+      }
+
+      auto visit_select = [&]() {
+          if (worth_exploring(select_bound, incumbent.cost, options, open_bounds))
+          {
+              state.select();
+              selection.push_back(cursor);
+              dive(select_cost, select_bound);
+              selection.pop_back();
+              state.rollback(checkpoint);
+          }
+      };
+      auto visit_drop = [&]() {
+          if (worth_exploring(drop_bound, incumbent.cost, options, open_bounds))
+          {
+              state.drop();
+              dive(cost, drop_bound);
+              state.rollback(checkpoint);
+          }
+      };
+      // the more promising child first
+      if (select_bound <= drop_bound)
+      {
+          visit_select();
+          visit_drop();
+      }
+      else
+      {
+          visit_drop();
+          visit_select();
+      }
+  }
+
+  void complete(double cost)
+  {
+      ++number_of_completions;
+      auto added = vector<int>();
+      cost += greedy_completion(problem, state.covered(), state.cursor, state.value, added);
+      if (cost < incumbent.cost)
+      {
+          auto completed = selection;
+          completed.insert(completed.end(), added.begin(), added.end());
+          incumbent.improve(cost, move(completed), sw.lap());
+      }
+  }
+
+private:
+  const BnbProblem &problem;
+  const BnbOptions &options;
+  SearchState state;
+  DualAscent duals;
+  vector<int> selection;
+  Incumbent &incumbent;
+  OpenBounds &open_bounds;
+  const WallStopwatch &sw;
+};
+} // namespace
+
+vector<int> best_first_search(const BnbProblem &problem, const BnbOptions &options, json &report)
+{
+    auto sw = WallStopwatch(); // timer
+    atomic<int> live_nodes(0);
+    int peak_number_of_nodes = 0;
+    long long number_of_nodes = 0, number_of_completions = 0, number_of_dives = 0;
+    auto coverage = Coverage(problem.incidence.number_of_elements());
+
+    auto incumbent = Incumbent();
+    seed(problem, options, incumbent, sw);
+    OpenBounds open_bounds;
+
+    // over the memory budget, the best nodes are explored depth-first instead of expanded, so the queue stops growing
+    const long long budget = node_budget(options);
+    auto diver = DepthFirstSearch(problem, options, incumbent, open_bounds, sw);
+    auto duals = RootDuals(problem, options);
+
+    using NodeQueue = priority_queue<shared_ptr<const SearchNode>, vector<shared_ptr<const SearchNode>>, ByLowerBound>;
+    auto nodes = NodeQueue();
+    {
+        auto root = make_shared<SearchNode>(nullptr, 0, false, 0, 0, live_nodes);
+        root->cost_lower_bound = problem.bound(0, 0, 0, coverage);
+        nodes.push(root);
+    }
+
+    while (nodes.size() > 0)
+    {
+        auto node = nodes.top();
+        nodes.pop();
+        ++number_of_nodes;
+
+        // after a better solution is found, the nodes added before may not be worth exploring any more,
+        // the queue is a min heap so none of the nodes left is
+        if (!worth_exploring(node->cost_lower_bound, incumbent.cost, options, open_bounds))
+        {
+            break;
+        }
+
+        sw.pause(); // pause the timer for debug informaiton
+        if (nodes.size() % 10000 == 0)
+        {
+            cout << "number of nodes: " << nodes.size() << ", current/optimal: " << node->cost_lower_bound << "/" << incumbent.cost << endl;
+        }
+        if (sw.lap() > options.deadline)
+        {
+            report["timed_out"] = true;
+            open_bounds.add(node->cost_lower_bound); // the lowest of the open nodes
+            break;
+        }
+        sw.continue_();
+
+        if (node->value >= problem.target_value)
+        {
+            incumbent.improve(node->cost, selection_of(*node), sw.lap());
+        }
+        else if (node->cursor != problem.ranges.size() && live_nodes.load() > budget)
+        {
+            long long explored = diver.number_of_nodes;
+            diver.explore(*node);
+            number_of_nodes += diver.number_of_nodes - explored - 1; // the node itself is counted already
+            ++number_of_dives;
+            if (diver.timed_out)
+            {
+                report["timed_out"] = true;
+                if (!nodes.empty())
+                {
+                    open_bounds.add(nodes.top()->cost_lower_bound);
+                }
+                break;
+            }
+        }
+        else if (node->cursor != problem.ranges.size())
+        {
+            // both children share the coverage of the node, which is materialized once. Replaying every decision
+            // to get a SearchState costs more than the two bounds it saves, so they are computed directly
+            materialize(*node, problem, coverage);
+            int cursor = node->cursor;
+
+            if (completion_due(options, number_of_nodes)) // the node has the lowest bound, complete it greedily
+            {
+                ++number_of_completions;
+                auto added = vector<int>();
+                double cost = node->cost + greedy_completion(problem, coverage, cursor, node->value, added);
+                if (cost < incumbent.cost)
+                {
+                    auto selection = selection_of(*node);
+                    selection.insert(selection.end(), added.begin(), added.end());
+                    incumbent.improve(cost, move(selection), sw.lap());
+                }
+            }
+
+            if (problem.can_reach(cursor + 1, node->value))
+            {
+                auto drop = make_shared<SearchNode>(node, cursor + 1, false, node->cost, node->value, live_nodes);
+                drop->cost_lower_bound = duals.tighten(problem.bound(cursor + 1, drop->cost, drop->value, coverage),
+                                                       cursor + 1, drop->cost, drop->value, coverage, incumbent.cost);
+                if (worth_exploring(drop->cost_lower_bound, incumbent.cost, options, open_bounds))
+                {
+                    nodes.push(drop);
+                }
+            }
+
+            double gained = problem.select(cursor, coverage);
+            auto select = make_shared<SearchNode>(node, cursor + 1, true, node->cost + problem.ranges[cursor].cost,
+                                                  node->value + gained, live_nodes);
+            select->cost_lower_bound = duals.tighten(problem.bound(cursor + 1, select->cost, select->value, coverage),
+                                                     cursor + 1, select->cost, select->value, coverage, incumbent.cost);
+            if (worth_exploring(select->cost_lower_bound, incumbent.cost, options, open_bounds))
+            {
+                nodes.push(select);
+            }
+        }
+        peak_number_of_nodes = max(peak_number_of_nodes, live_nodes.load());
+    }
+
+    report_search(report, "best_first", number_of_nodes, peak_number_of_nodes, sw.lap());
+    report["number_of_completions"] = number_of_completions + diver.number_of_completions;
+    report["number_of_dives"] = number_of_dives;
+    incumbent.report(report);
+    open_bounds.report(report, incumbent.cost);
+    return incumbent.selection;
+}
+
+namespace
+{
+// Best-first search over sharded queues, one per worker. A worker expands the best node of its own shard and steals
+// the best node of another shard when its own is empty. The incumbent cost is shared, so every worker prunes with an
+// improvement as soon as it is found.
+class ParallelBestFirstSearch
+{
+public:
+  ParallelBestFirstSearch(const BnbProblem &problem, const BnbOptions &options)
+      : problem(problem), options(options), shards(options.threads)
+  {
+  }
+
+  vector<int> run(json &report)
+  {
+      seed(problem, options, incumbent, sw);
+      best_cost = incumbent.cost;
+      {
+          auto coverage = Coverage(problem.incidence.number_of_elements());
+          auto root = make_shared<SearchNode>(nullptr, 0, false, 0, 0, live_nodes);
+          root->cost_lower_bound = problem.bound(0, 0, 0, coverage);
+          push(0, root);
+      }
+
+      auto workers = vector<thread>();
+      for (int i = 0; i < options.threads; ++i)
+      {
+          workers.emplace_back(&ParallelBestFirstSearch::work, this, i);
+      }
+      for (auto &worker : workers)
+      {
+          worker.join();
+      }
+      report["threads"] = options.threads;
+      report["number_of_steals"] = number_of_steals.load();
+      report_search(report, "best_first", number_of_nodes, peak_number_of_nodes, sw.lap());
+      report["number_of_completions"] = number_of_completions.load();
+      incumbent.report(report);
+      if (timed_out)
+      {
+          report["timed_out"] = true;
+          for (auto &shard : shards) // the lowest of the open nodes
+          {
+              if (!shard.nodes.empty())
+              {
+                  open_bounds.add(shard.nodes.top()->cost_lower_bound);
+              }
+          }
+      }
+      open_bounds.report(report, incumbent.cost);
+      return incumbent.selection;
+  }
+
+private:
+  struct Shard
+  {
+      mutex lock;
+      priority_queue<shared_ptr<const SearchNode>, vector<shared_ptr<const SearchNode>>, ByLowerBound> nodes;
+  };
+
+  void push(int shard, shared_ptr<const SearchNode> node)
+  {
+      ++pending;
+      lock_guard<mutex> guard(shards[shard].lock);
+      shards[shard].nodes.push(move(node));
+  }
+
+  shared_ptr<const SearchNode> pop(int shard)
+  {
+      for (int i = 0; i < shards.size(); ++i)
+      {
+          auto &victim = shards[(shard + i) % shards.size()];
+          lock_guard<mutex> guard(victim.lock);
+          if (!victim.nodes.empty())
+          {
+              auto node = victim.nodes.top();
+              victim.nodes.pop();
+              if (i > 0)
+              {
+                  ++number_of_steals;
+              }
+              return node;
+          }
+      }
+      return nullptr;
+  }
+
+  void work(int shard)
+  {
+      auto coverage = Coverage(problem.incidence.number_of_elements());
+      auto duals = RootDuals(problem, options);
+      long long local_number_of_nodes = 0;
+      int local_peak_number_of_nodes = 0;
+      while (pending > 0 && !timed_out)
+      {
+          auto node = pop(shard);
+          if (node == nullptr) // the other workers are still expanding
+          {
+              this_thread::yield();
+              continue;
+          }
+          ++local_number_of_nodes;
+          if (sw.lap() > options.deadline)
+          {
+              timed_out = true;
+              open_bounds.add(node->cost_lower_bound);
+          }
+          else
+          {
+              expand(node, shard, coverage, duals, local_number_of_nodes);
+          }
+          node = nullptr;
+          local_peak_number_of_nodes = max(local_peak_number_of_nodes, live_nodes.load());
+          --pending; // the children are counted before their parent is done
+      }
+
+      lock_guard<mutex> guard(incumbent_lock);
+      number_of_nodes += local_number_of_nodes;
+      peak_number_of_nodes = max(peak_number_of_nodes, local_peak_number_of_nodes);
+  }
+
+  void improve(double cost, vector<int> selection)
+  {
+      lock_guard<mutex> guard(incumbent_lock);
+      if (incumbent.improve(cost, move(selection), sw.lap()))
+      {
+          best_cost = cost;
+      }
+  }
+
+  void expand(const shared_ptr<const SearchNode> &node, int shard, Coverage &coverage, RootDuals &duals,
+              long long number_of_nodes)
+  {
+      if (!worth_exploring(node->cost_lower_bound, best_cost, options, open_bounds)) // pruned by an incumbent found since it was queued
+      {
+          return;
+      }
+      if (node->value >= problem.target_value)
+      {
+          if (node->cost < best_cost) // lower cost, great
+          {
+              improve(node->cost, selection_of(*node));
+          }
+          return;
+      }
+      if (node->cursor == problem.ranges.size())
+      {
+          return;
+      }
+
+      materialize(*node, problem, coverage);
+      int cursor = node->cursor;
+      if (completion_due(options, number_of_nodes))
+      {
+          ++number_of_completions;
+          auto added = vector<int>();
+          double cost = node->cost + greedy_completion(problem, coverage, cursor, node->value, added);
+          if (cost < best_cost)
+          {
+              auto selection = selection_of(*node);
+              selection.insert(selection.end(), added.begin(), added.end());
+              improve(cost, move(selection));
+          }
+      }
+
+      if (problem.can_reach(cursor + 1, node->value))
+      {
+          auto drop = make_shared<SearchNode>(node, cursor + 1, false, node->cost, node->value, live_nodes);
+          drop->cost_lower_bound = duals.tighten(problem.bound(cursor + 1, drop->cost, drop->value, coverage),
+                                                 cursor + 1, drop->cost, drop->value, coverage, best_cost);
+          if (worth_exploring(drop->cost_lower_bound, best_cost, options, open_bounds))
+          {
+              push(shard, drop);
+          }
+      }
+      double gained = problem.select(cursor, coverage);
+      auto select = make_shared<SearchNode>(node, cursor + 1, true, node->cost + problem.ranges[cursor].cost,
+                                            node->value + gained, live_nodes);
+      select->cost_lower_bound = duals.tighten(problem.bound(cursor + 1, select->cost, select->value, coverage),
+                                               cursor + 1, select->cost, select->value, coverage, best_cost);
+      if (worth_exploring(select->cost_lower_bound, best_cost, options, open_bounds))
+      {
+          push(shard, select);
+      }
+  }
+
+private:
+  const BnbProblem &problem;
+  const BnbOptions &options;
+  atomic<int> live_nodes{0}; // declared before the shards, the nodes left in them after a timeout count it down
+  vector<Shard> shards;
+  atomic<long long> pending{0}; // nodes queued or being expanded
+  atomic<long long> number_of_steals{0};
+  atomic<long long> number_of_completions{0};
+  atomic<bool> timed_out{false};
+  OpenBounds open_bounds;
+  WallStopwatch sw;
+
+  mutex incumbent_lock; // guards the incumbent and the counters merged by the workers
+  Incumbent incumbent;
+  atomic<double> best_cost{numeric_limits<double>::max()}; // the cost of the incumbent, read without the lock
+  long long number_of_nodes = 0;
+  int peak_number_of_nodes = 0;
+};
+} // namespace
+
+vector<int> parallel_best_first_search(const BnbProblem &problem, const BnbOptions &options, json &report)
+{
+    return ParallelBestFirstSearch(problem, options).run(report);
+}
+
+vector<int> depth_first_search(const BnbProblem &problem, const BnbOptions &options, json &report)
+{
+    auto sw = WallStopwatch(); // timer
+    auto incumbent = Incumbent();
+    seed(problem, options, incumbent, sw);
+    OpenBounds open_bounds;
+
+    auto search = DepthFirstSearch(problem, options, incumbent, open_bounds, sw);
+    search.explore_root();
+    if (search.timed_out)
+    {
+        report["timed_out"] = true;
+    }
+    report_search(report, "dfs", search.number_of_nodes, search.peak_number_of_nodes, sw.lap());
+    report["number_of_completions"] = search.number_of_completions;
+    incumbent.report(report);
+    open_bounds.report(report, incumbent.cost);
+    return incumbent.selection;
+}
@@ -0,0 +1,123 @@
+#ifndef CGSC_BNB_H
+#define CGSC_BNB_H
+
+#include <cstdint>
+#include <vector>
+
+#include "optimizer.h"
+
+// Packed set of covered elements. Every element set is logged, so a search can go back to a checkpoint in place.
+class Coverage
+{
+public:
+  Coverage(int number_of_elements = 0);
+  bool test(int element) const { return words[element >> 6] >> (element & 63) & 1; }
+  void set(int element) // element should not be covered yet
+  {
+    words[element >> 6] |= uint64_t(1) << (element & 63);
+    log.push_back(element);
+  }
+  int checkpoint() const { return log.size(); }
+  void rollback(int checkpoint);
+
+private:
+  std::vector<uint64_t> words;
+  std::vector<int> log;
+};
+
+// The instance seen by the searches, ranges are sorted by unit cost from lower to higher and referred to by position
+struct BnbProblem
+{
+  BnbProblem(const Universe &universe, const Ranges &ranges, double target_coverage);
+  double select(int cursor, Coverage &coverage) const; // covers ranges[cursor], returns the value gained
+  // optimistic cost to reach the target with ranges[cursor:], computed from scratch, coverage is left unchanged
+  double bound(int cursor, double cost, double value, Coverage &coverage) const;
+  // whether the target is still reachable with ranges[cursor:], in O(1)
+  bool can_reach(int cursor, double value) const { return value + suffix_values[cursor] >= target_value; }
+
+  const Incidence &incidence;
+  Ranges ranges;
+  double target_value;
+  std::vector<double> unit_costs;    // cost / value of each range
+  std::vector<double> claims;        // claim profile of the root, see SearchState
+  std::vector<int> next_holders;     // for each entry of incidence.range_elements, the next range holding the element
+  std::vector<double> suffix_values; // value of the union of ranges[cursor:]
+  std::vector<int> holder_offsets;   // the positions holding each element, in increasing order, CSR like the incidence
+  std::vector<int> holders;
+};
+
+// The coverage of a node and its claim profile. Every uncovered element is claimed by the first range from the
+// cursor on that holds it, the lower bound fills the deficit with the claims in unit cost order.
+// Selecting or dropping the range at the cursor only moves the claims of its elements, and is undone exactly,
+// so the bound of a child is derived from the state of its parent.
+class SearchState
+{
+public:
+  struct Checkpoint
+  {
+    int cursor;
+    double value;
+    int coverage;
+    int claims;
+  };
+
+  SearchState(const BnbProblem &problem);
+  double select(); // selects ranges[cursor] and returns the value gained
+  void drop();     // drops ranges[cursor]
+  double bound(double cost) const;
+  Checkpoint checkpoint() const { return Checkpoint{cursor, value, coverage.checkpoint(), static_cast<int>(claims_log.size())}; }
+  void rollback(const Checkpoint &checkpoint);
+  const Coverage &covered() const { return coverage; }
+
+  int cursor = 0;   // next range to select (or not select)
+  double value = 0; // current covered area
+
+private:
+  void set_claim(int position, double claim);
+
+private:
+  const BnbProblem &problem;
+  Coverage coverage;
+  std::vector<double> claims;
+  std::vector<std::pair<int, double>> claims_log; // (position, previous claim)
+};
+
+// Lower bound of a node from the LP relaxation, by dual ascent. Every element has a price per unit of value, and the
+// prices of the elements of an open range never sum above its cost. Buying the deficit from the cheapest uncovered
+// elements at these prices is a lower bound of the LP, the ascent raises the prices of the cheapest ones to a common
+// level by spending the slack of their ranges.
+// Deciding ranges only relaxes the constraints, so the prices of a node warm start the ascent of its children.
+class DualAscent
+{
+public:
+  DualAscent(const BnbProblem &problem);
+  // raises the prices for the node and returns its bound, the prices are kept until rolled back
+  double bound(int cursor, double cost, double value, const Coverage &coverage);
+  int checkpoint() const { return log.size(); }
+  void rollback(int checkpoint);
+
+private:
+  double fill(double deficit, int &filled) const; // cost of the deficit at the prices, filled is set to the elements bought
+
+private:
+  const BnbProblem &problem;
+  std::vector<double> prices;
+  std::vector<std::pair<int, double>> log; // (element, previous price)
+  std::vector<double> slacks;              // cost left to each open range by the prices of its uncovered elements
+  std::vector<int> candidates;             // the uncovered elements held by an open range, in price order
+  std::vector<int> seen;                   // the node an element was last collected for
+  int number_of_bounds = 0;
+};
+
+// Greedily extends a partial selection with ranges[cursor:] until the target is reached. The positions added are
+// appended to added in increasing order and their cost is returned, or max if the target cannot be reached.
+double greedy_completion(const BnbProblem &problem, const Coverage &coverage, int cursor, double value,
+                         std::vector<int> &added);
+
+// The searches return the positions in problem.ranges of the cheapest selection found, empty if there is none
+std::vector<int> best_first_search(const BnbProblem &problem, const BnbOptions &options, nlohmann::json &report);
+// best-first search with options.threads workers
+std::vector<int> parallel_best_first_search(const BnbProblem &problem, const BnbOptions &options, nlohmann::json &report);
+std::vector<int> depth_first_search(const BnbProblem &problem, const BnbOptions &options, nlohmann::json &report);
+
+#endif
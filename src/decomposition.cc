@@ -0,0 +1,396 @@
+#include "decomposition.h"
+
+#include <algorithm>
+#include <atomic>
+#include <map>
+#include <numeric>
+#include <thread>
+#include <unordered_map>
+
+using namespace std;
+using nlohmann::json;
+
+namespace
+{
+// the components of at most so many ranges are enumerated, which visits at most 2^max_enumerated_size selections
+const int max_enumerated_size = 12;
+
+// the positions of the ranges of every component, the elements held by no range belong to none
+vector<vector<int>> components_of(const Incidence &incidence, const Ranges &ranges)
+{
+    auto positions = vector<int>(incidence.number_of_ranges(), -1);
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        positions[ranges[i].id] = i;
+    }
+    auto parents = vector<int>(ranges.size());
+    iota(parents.begin(), parents.end(), 0);
+    auto find = [&parents](int i) {
+        while (parents[i] != i)
+        {
+            i = parents[i] = parents[parents[i]];
+        }
+        return i;
+    };
+    for (int element = 0; element < incidence.number_of_elements(); ++element)
+    {
+        int first = -1;
+        for (auto range_id : incidence.ranges_of(element))
+        {
+            int i = positions[range_id];
+            if (i < 0)
+            {
+                continue;
+            }
+            if (first < 0)
+            {
+                first = find(i);
+            }
+            else
+            {
+                parents[find(i)] = first;
+            }
+        }
+    }
+
+    auto roots = map<int, int>(); // root -> component
+    auto components = vector<vector<int>>();
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        auto root = roots.emplace(find(i), components.size());
+        if (root.second)
+        {
+            components.emplace_back();
+        }
+        components[root.first->second].push_back(i);
+    }
+    return components;
+}
+
+struct CurvePoint
+{
+    double cost;
+    double value; // capped at the target, more is worth nothing
+    vector<int> selection;
+};
+
+// Enumerates the selections of a component by depth-first search and keeps the Pareto curve of cost against value.
+// A subtree is skipped when a point found already is as cheap as its root and worth as much as it can reach.
+class Frontier
+{
+public:
+  Frontier(const Incidence &incidence, const Ranges &ranges, vector<int> component, double target_value)
+      : incidence(incidence), ranges(ranges), positions(move(component)), target_value(target_value),
+        counts(incidence.number_of_elements(), 0)
+  {
+      sort(positions.begin(), positions.end(), [&ranges](int a, int b) { // unit cost from lower to higher
+          return ranges[a].cost / ranges[a].value < ranges[b].cost / ranges[b].value;
+      });
+      suffix_values.assign(positions.size() + 1, 0);
+      for (int p = positions.size() - 1; p >= 0; --p)
+      {
+          suffix_values[p] = suffix_values[p + 1] + ranges[positions[p]].value;
+      }
+  }
+
+  vector<CurvePoint> run()
+  {
+      enumerate(0, 0, 0);
+      auto curve = vector<CurvePoint>();
+      for (auto &point : points)
+      {
+          curve.push_back(CurvePoint{point.first, point.second.first, move(point.second.second)});
+      }
+      return curve;
+  }
+
+  long long number_of_selections = 0;
+
+private:
+  void enumerate(int cursor, double cost, double value)
+  {
+      ++number_of_selections;
+      insert(cost, min(value, target_value));
+      for (int p = cursor; p < positions.size() && value < target_value; ++p)
+      {
+          if (dominated(cost + ranges[positions[p]].cost, min(value + suffix_values[p], target_value)))
+          {
+              continue;
+          }
+          double gained = 0;
+          for (auto element : incidence.elements_of(ranges[positions[p]].id))
+          {
+              gained += counts[element]++ == 0 ? incidence.values[element] : 0;
+          }
+          selection.push_back(positions[p]);
+          enumerate(p + 1, cost + ranges[positions[p]].cost, value + gained);
+          selection.pop_back();
+          for (auto element : incidence.elements_of(ranges[positions[p]].id))
+          {
+              --counts[element];
+          }
+      }
+  }
+
+  // whether a point at most as expensive is worth at least the value
+  bool dominated(double cost, double value) const
+  {
+      auto cheaper = points.upper_bound(cost);
+      return cheaper != points.begin() && prev(cheaper)->second.first >= value;
+  }
+
+  void insert(double cost, double value)
+  {
+      if (dominated(cost, value))
+      {
+          return;
+      }
+      // the points as expensive and worth no more are dominated by the new one
+      auto point = points.lower_bound(cost);
+      while (point != points.end() && point->second.first <= value)
+      {
+          point = points.erase(point);
+      }
+      points[cost] = make_pair(value, selection);
+  }
+
+private:
+  const Incidence &incidence;
+  const Ranges &ranges;
+  vector<int> positions;
+  double target_value;
+  vector<double> suffix_values; // total value of positions[p:], which bounds the value of their union
+  vector<int> counts;           // the selected ranges holding each element
+  vector<int> selection;
+  map<double, pair<double, vector<int>>> points; // cost -> (value, selection), the value increases with the cost
+};
+
+// A component as an instance of its own, its ranges are numbered in the order of their positions
+struct Component
+{
+    Universe universe;
+    Ranges ranges;
+};
+
+Component extract(const Universe &universe, const Ranges &ranges, const vector<int> &positions)
+{
+    const auto &incidence = universe.incidence;
+    auto builder = IncidenceBuilder();
+    auto elements = unordered_map<int, int>(); // element of the instance -> element of the component
+    for (int i = 0; i < positions.size(); ++i)
+    {
+        for (auto element : incidence.elements_of(ranges[positions[i]].id))
+        {
+            auto local = elements.emplace(element, builder.number_of_elements());
+            if (local.second)
+            {
+                builder.add_element(incidence.values[element]);
+            }
+            builder.add(i, local.first->second);
+        }
+    }
+    auto component = Component();
+    component.universe.roi = universe.roi;
+    component.universe.incidence = builder.build(positions.size());
+    component.universe.update_value();
+    for (int i = 0; i < positions.size(); ++i)
+    {
+        component.ranges.push_back(ranges[positions[i]]);
+        component.ranges.back().id = i;
+        component.ranges.back().update_value(component.universe.incidence);
+    }
+    return component;
+}
+
+// The covers the optimizer finds on the component alone for evenly spaced targets, up to the value of the component
+// the global target can use, and for the global target coverage, which splits the target evenly
+vector<CurvePoint> optimize_curve(const Component &component, const vector<int> &positions, const Optimizer &optimizer,
+                                  int coverage_levels, double target_value, long long &number_of_optimizations)
+{
+    const auto &incidence = component.universe.incidence;
+    double highest = min(1.0, target_value / component.universe.value);
+    auto targets = vector<double>();
+    for (int level = 1; level <= coverage_levels; ++level)
+    {
+        targets.push_back(highest * level / coverage_levels);
+    }
+    if (optimizer.target() < highest)
+    {
+        targets.push_back(optimizer.target());
+    }
+
+    auto curve = vector<CurvePoint>{CurvePoint{0, 0, vector<int>()}};
+    for (auto target : targets)
+    {
+        auto result_ranges = Ranges();
+        optimizer.with_target(target)->optimize(component.universe, component.ranges, result_ranges);
+        ++number_of_optimizations;
+        if (result_ranges.empty()) // no cover was found, the B&B may stop at its deadline without one
+        {
+            continue;
+        }
+        auto point = CurvePoint{0, 0, vector<int>()};
+        auto covered = vector<bool>(incidence.number_of_elements(), false);
+        for (const auto &range : result_ranges)
+        {
+            point.cost += range.cost;
+            point.selection.push_back(positions[range.id]);
+            for (auto element : incidence.elements_of(range.id))
+            {
+                point.value += covered[element] ? 0 : incidence.values[element];
+                covered[element] = true;
+            }
+        }
+        point.value = min(point.value, target_value);
+        curve.push_back(move(point));
+    }
+    return curve;
+}
+
+struct Choice
+{
+    double cost;
+    double value;
+    int previous; // in the previous layer
+    int point;    // in the curve of the component
+};
+
+// the Pareto set of the choices, by cost with increasing value
+vector<Choice> pareto(vector<Choice> choices)
+{
+    sort(choices.begin(), choices.end(), [](const Choice &a, const Choice &b) {
+        return a.cost < b.cost || (a.cost == b.cost && a.value > b.value);
+    });
+    auto kept = vector<Choice>();
+    for (const auto &choice : choices)
+    {
+        if (kept.empty() || choice.value > kept.back().value)
+        {
+            kept.push_back(choice);
+        }
+    }
+    return kept;
+}
+} // namespace
+
+json solve_by_components(const Universe &universe, const Ranges &ranges, const Optimizer &optimizer,
+                         int coverage_levels, int threads, Ranges &result_ranges)
+{
+    auto report = json();
+    report["decomposed"] = false;
+    report["optimizer"] = optimizer.tag();
+    const auto &incidence = universe.incidence;
+    auto components = components_of(incidence, ranges);
+    int largest = 0;
+    for (const auto &component : components)
+    {
+        largest = max(largest, static_cast<int>(component.size()));
+    }
+    report["number_of_components"] = components.size();
+    report["largest_component"] = largest;
+    if (components.size() < 2)
+    {
+        return report;
+    }
+
+    // the curves are built by workers taking the components in turn, the largest first. Each optimization runs on
+    // its own optimizer, from with_target, so the workers share nothing but the instance, which they only read
+    double target_value = universe.value * optimizer.target();
+    sort(components.begin(), components.end(), [](const vector<int> &a, const vector<int> &b) {
+        return a.size() > b.size();
+    });
+    auto curves = vector<vector<CurvePoint>>(components.size());
+    auto exact = vector<char>(components.size()); // not vector<bool>, the workers set their own components
+    auto number_of_selections = vector<long long>(components.size(), 0);
+    auto number_of_optimizations = vector<long long>(components.size(), 0);
+    atomic<int> next(0);
+    auto work = [&]() {
+        for (int c = next++; c < components.size(); c = next++)
+        {
+            exact[c] = components[c].size() <= max_enumerated_size;
+            if (exact[c])
+            {
+                auto frontier = Frontier(incidence, ranges, components[c], target_value);
+                curves[c] = frontier.run();
+                number_of_selections[c] = frontier.number_of_selections;
+            }
+            else
+            {
+                curves[c] = optimize_curve(extract(universe, ranges, components[c]), components[c], optimizer,
+                                           coverage_levels, target_value, number_of_optimizations[c]);
+            }
+        }
+    };
+    auto workers = vector<thread>();
+    for (int i = 1; i < min<int>(threads, components.size()); ++i)
+    {
+        workers.emplace_back(work);
+    }
+    work(); // a single thread starts no worker
+    for (auto &worker : workers)
+    {
+        worker.join();
+    }
+
+    // knapsack over the components, a layer keeps the Pareto set of the choices made so far
+    auto layers = vector<vector<Choice>>{{Choice{0, 0, -1, -1}}};
+    for (const auto &curve : curves)
+    {
+        auto choices = vector<Choice>();
+        for (int previous = 0; previous < layers.back().size(); ++previous)
+        {
+            const auto &choice = layers.back()[previous];
+            for (int point = 0; point < curve.size(); ++point)
+            {
+                choices.push_back(Choice{choice.cost + curve[point].cost,
+                                         min(choice.value + curve[point].value, target_value), previous, point});
+            }
+        }
+        layers.push_back(pareto(move(choices)));
+    }
+
+    result_ranges.clear();
+    const auto &last = layers.back();
+    auto best = find_if(last.begin(), last.end(), [target_value](const Choice &choice) {
+        return choice.value >= target_value;
+    });
+    if (best != last.end())
+    {
+        for (int c = curves.size() - 1, choice = best - last.begin(); c >= 0; --c)
+        {
+            for (auto i : curves[c][layers[c + 1][choice].point].selection)
+            {
+                result_ranges.push_back(ranges[i]);
+            }
+            choice = layers[c + 1][choice].previous;
+        }
+    }
+
+    double value = 0;
+    auto covered = vector<bool>(incidence.number_of_elements(), false);
+    for (const auto &range : result_ranges)
+    {
+        for (auto element : incidence.elements_of(range.id))
+        {
+            value += covered[element] ? 0 : incidence.values[element];
+            covered[element] = true;
+        }
+    }
+    // the curves of the optimized components are only as good as the optimizer, and sample the coverage, so the
+    // cover is the cheapest only when every component was enumerated
+    report["decomposed"] = true;
+    report["exact"] = all_of(exact.begin(), exact.end(), [](char component_exact) { return component_exact != 0; });
+    report["actual_coverage"] = value / universe.value;
+    report["components"] = json::array();
+    for (int c = 0; c < components.size(); ++c)
+    {
+        report["components"].push_back({{"number_of_ranges", components[c].size()},
+                                        {"exact", exact[c] != 0},
+                                        {"number_of_curve_points", curves[c].size()}});
+    }
+    report["number_of_enumerated_components"] = count(exact.begin(), exact.end(), 1);
+    report["number_of_enumerated_selections"] = func::sum(number_of_selections, func::identity<long long>);
+    report["number_of_optimizations"] = func::sum(number_of_optimizations, func::identity<long long>);
+    report["number_of_curve_points"] = func::sum(curves, [](const vector<CurvePoint> &curve) { return curve.size(); });
+    return report;
+}
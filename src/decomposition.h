@@ -0,0 +1,17 @@
+#ifndef CGSC_DECOMPOSITION_H
+#define CGSC_DECOMPOSITION_H
+
+#include "model.h"
+#include "optimizer.h"
+
+// The connected components of the range - element graph are solved apart, by up to threads workers. The curve of cost
+// against value of every component is built, then the curves are combined by a knapsack over the components to reach
+// the target at the lowest cost. The curve of a component of a few ranges is enumerated exactly, the curve of a
+// larger one is made of the covers the optimizer finds for coverage_levels evenly spaced targets, and the global
+// target coverage itself, on the component alone.
+// Returns the report, "decomposed" is false when the instance does not split and is left to be solved as a whole, and
+// "exact" is false when a component was optimized, so the cover may not be the cheapest.
+nlohmann::json solve_by_components(const Universe &universe, const Ranges &ranges, const Optimizer &optimizer,
+                                   int coverage_levels, int threads, Ranges &result_ranges);
+
+#endif
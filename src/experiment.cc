@@ -2,6 +2,7 @@
 
 #include <iostream>
 #include <fstream>
+#include <map>
 #include "csv.hpp"
 #include "global.h"
 #include "solver.h"
@@ -38,7 +39,12 @@ class Loader
             return Product{parse_polygon(polygon), stod(price)};
         };
 
-        return parse_csv(path, num, callback, "Polygon", "Price");
+        auto products = parse_csv(path, num, callback, "Polygon", "Price");
+        for (int i = 0; i < products.size(); ++i)
+        {
+            products[i].id = i;
+        }
+        return products;
     }
 
   private:
@@ -88,16 +94,71 @@ void experiment(const json &settings)
                                         settings["num_rois"].get<int>());
 
     const auto &products = loader.load_products(settings["archive_size"].get<int>());
+    auto product_index = make_shared<const GridIndex>(func::map(products, [](const Product &product) {
+        return bounding_box(product.polygon);
+    }));
 
     auto online_transformation = make_shared<OnlineTranformer>();
     auto continuous_transformer = make_shared<ContinuousTransformer>();
     auto fast_continuous_transformer = make_shared<FastContinuousTransformer>();
+    auto sampling_transformer = make_shared<SamplingTransformer>(settings.value("number_of_samples", 100000));
     auto greedy_optimizer = make_shared<GreedyOptimizer>(settings["target_coverage"].get<double>());
-    auto bnb_optimizer = make_shared<BnbOptimizer>(settings["target_coverage"].get<double>());
+    auto lazy_greedy_optimizer = make_shared<LazyGreedyOptimizer>(settings["target_coverage"].get<double>());
+    auto lagrangian_optimizer = make_shared<LagrangianOptimizer>(settings["target_coverage"].get<double>(),
+                                                                 settings.value("max_iterations", 500));
+    auto bnb_options = BnbOptions();
+    bnb_options.search = settings.value("search", bnb_options.search);
+    bnb_options.bound = settings.value("bound", bnb_options.bound);
+    bnb_options.threads = settings.value("threads", bnb_options.threads);
+    bnb_options.deadline = settings.value("deadline", bnb_options.deadline);
+    bnb_options.gap = settings.value("gap", bnb_options.gap);
+    bnb_options.greedy_seed = settings.value("greedy_seed", bnb_options.greedy_seed);
+    bnb_options.completion_interval = settings.value("completion_interval", bnb_options.completion_interval);
+    bnb_options.memory_budget = settings.value("memory_budget", bnb_options.memory_budget);
+    auto bnb_optimizer = make_shared<BnbOptimizer>(settings["target_coverage"].get<double>(), bnb_options);
     auto online_bnb_optimizer = make_shared<OnlineBnbOptimizer>(settings["target_coverage"].get<double>());
 
-    auto perform = [&products, &reports](const Roi &roi, shared_ptr<Transformer> transformer, shared_ptr<Optimizer> optimizer) {
-        auto solver = Solver(transformer, optimizer);
+    // the transformer and optimizer to run are picked by their tags, online and old_bnb by default
+    auto transformers = map<string, shared_ptr<Transformer>>{
+        {online_transformation->tag(), online_transformation},
+        {continuous_transformer->tag(), continuous_transformer},
+        {fast_continuous_transformer->tag(), fast_continuous_transformer},
+        {sampling_transformer->tag(), sampling_transformer},
+    };
+    if (settings.count("delta"))
+    {
+        // the raster cache is kept next to the archive, a file per grid step
+        auto raster_cache = shared_ptr<RasterCache>();
+        if (settings.value("raster_cache", false))
+        {
+            ostringstream oss;
+            oss << settings["products_dir"].get<string>() << "/archive_" << settings["delta"].get<double>() << ".cells";
+            raster_cache = make_shared<RasterCache>(products, settings["delta"].get<double>(), oss.str(),
+                                                    settings.value("raster_cache_capacity", 256.0));
+        }
+        auto discrete_transformer = make_shared<DiscreteTransformer>(settings["delta"].get<double>(), raster_cache);
+        transformers[discrete_transformer->tag()] = discrete_transformer;
+        auto quadtree_transformer = make_shared<QuadtreeTransformer>(settings["delta"].get<double>());
+        transformers[quadtree_transformer->tag()] = quadtree_transformer;
+        auto hybrid_transformer = make_shared<HybridTransformer>(settings["delta"].get<double>());
+        transformers[hybrid_transformer->tag()] = hybrid_transformer;
+    }
+    auto optimizers = map<string, shared_ptr<Optimizer>>{
+        {greedy_optimizer->tag(), greedy_optimizer},
+        {lazy_greedy_optimizer->tag(), lazy_greedy_optimizer},
+        {lagrangian_optimizer->tag(), lagrangian_optimizer},
+        {bnb_optimizer->tag(), bnb_optimizer},
+        {online_bnb_optimizer->tag(), online_bnb_optimizer},
+        {"none", nullptr},
+    };
+    auto transformer = transformers.at(settings.value("transformer", online_transformation->tag()));
+    auto optimizer = optimizers.at(settings.value("optimizer", online_bnb_optimizer->tag()));
+    bool reduction = settings.value("reduction", true);
+    int coverage_levels = settings.value("coverage_levels", 0);
+    int threads = settings.value("threads", 1); // also the workers of the decomposition
+
+    auto perform = [&products, &product_index, &reports, reduction, coverage_levels, threads](const Roi &roi, shared_ptr<Transformer> transformer, shared_ptr<Optimizer> optimizer) {
+        auto solver = Solver(transformer, optimizer, product_index, reduction, coverage_levels, threads);
         reports.push_back(solver.solve(roi, products, Products()));
         cout << reports.back().dump(4) << endl;
     };
@@ -106,8 +167,7 @@ void experiment(const json &settings)
     for (const auto &roi : rois)
     {
         cout << "Round " << cnt++ << endl;
-        perform(roi, online_transformation, online_bnb_optimizer);
-        // perform(roi, fast_continuous_transformer, bnb_optimizer);
+        perform(roi, transformer, optimizer);
     }
 
     {
@@ -1,6 +1,7 @@
 #include "geometry.h"
 
 #include <algorithm>
+#include <iterator>
 #include <queue>
 #include <functional>
 #include <sstream>
@@ -121,9 +122,95 @@ bool disjoints(const Polygon &a, const Polygon &b)
     return !intersects(a, b);
 }
 
+// true if an edge of a is a separating axis, i.e. b lies entirely on the outer side of it,
+// points closer than tolerance to the edge are regarded as on the edge
+static bool separated_by_edges_of(const Polygon &a, const Polygon &b, double tolerance = 0)
+{
+    double orientation = area(a) < 0 ? -1 : 1; // outer side is the right side of a counter-clockwise polygon
+    auto s = a.back();
+    for (const auto &e : a)
+    {
+        auto u = e - s;
+        if (u != Point(0, 0) && // clipped polygons may repeat a vertex
+            all_of(b.begin(), b.end(), [&](const Point &p) { return orientation * cross(u, p - s) <= tolerance * magnitude(u); }))
+        {
+            return true;
+        }
+        s = e;
+    }
+    return false;
+}
+
+// area of a clipped by the half planes of the convex, counter-clockwise b, without building any Polygon
+static double overlap_area(const Polygon &a, const Polygon &b)
+{
+    thread_local vector<Point> inner, prev_inner; // reused between calls to avoid allocation
+    inner.assign(a.begin(), a.end());
+    auto s1 = b.back();
+    for (const auto &e1 : b)
+    {
+        swap(inner, prev_inner);
+        inner.clear();
+        if (prev_inner.size() == 0)
+        {
+            break;
+        }
+        auto u = e1 - s1;
+        auto s2 = prev_inner.back();
+        double ds = cross(u, s2 - s1);
+        for (const auto &e2 : prev_inner)
+        {
+            double de = cross(u, e2 - s1);
+            if (ds >= 0 && de >= 0)
+            {
+                inner.push_back(e2);
+            }
+            else if (ds >= 0 || de >= 0) // the edge s2e2 crosses the line s1e1
+            {
+                auto p = s2 + (e2 - s2) * (ds / (ds - de));
+                inner.push_back(p);
+                if (de >= 0)
+                {
+                    inner.push_back(e2);
+                }
+            }
+            s2 = e2;
+            ds = de;
+        }
+        s1 = e1;
+    }
+
+    double ret = 0;
+    if (inner.size() > 0)
+    {
+        auto s = inner.back();
+        for (const auto &e : inner)
+        {
+            ret += cross(s, e);
+            s = e;
+        }
+    }
+    return 0.5 * ret;
+}
+
 bool intersects(const Polygon &a, const Polygon &b)
 {
-    return intersection(a, b).size() > 0;
+    // bounding box and separating axis rejections are cheap, most pairs are decided here
+    // clip() needs a vertex of a to be further than its collinear threshold inside every edge of b
+    if (!overlaps(bounding_box(a), bounding_box(b)) ||
+        separated_by_edges_of(a, b) ||
+        separated_by_edges_of(b, a, 1e-5))
+    {
+        return false;
+    }
+    double b_area = area(b);
+    if (b_area <= 0 || !convex(b)) // clip() rejects a clockwise or non-convex clipper
+    {
+        return false;
+    }
+    // same as intersection(a, b).size() > 0: pieces smaller than the threshold of clip() are discarded
+    double threshold_area = max(area(a), b_area) * 1e-6;
+    return overlap_area(a, b) > threshold_area;
 }
 
 bool intersects(const Point &a, const Point &b, const Point &c, const Point &d)
@@ -137,7 +224,7 @@ bool convex(const Polygon &polygon)
     auto b = *prev(polygon.end());
     for (const auto &c : polygon)
     {
-        if (area(Polygon{a, b, c}) < 0)
+        if (cross(c, a) + cross(a, b) + cross(b, c) < 0) // i.e. area(Polygon{a, b, c}) < 0
         {
             return false;
         }
@@ -173,30 +260,33 @@ Point line_intersection(const Point &a, const Point &b, const Point &c, const Po
     return e;
 }
 
-tuple<Polygons, Polygons> clip(const Polygon &clippee, const Polygon &clipper) // inner, outer
+void clip(const Polygon &clippee, const Polygon &clipper, Polygons &inners, Polygons &outers, double tolerance)
 {
+    inners.clear();
+    outers.clear();
+
     double clippee_area = area(clippee);
     double clipper_area = area(clipper);
-    double threshold_area = max(clippee_area, clipper_area) * 1e-6; // if a piece is smaller than this, discard it.
+    double threshold_area = max(clippee_area, clipper_area) * tolerance; // if a piece is smaller than this, discard it.
     if (!convex(clipper))
     {
         cerr << "Clip Error: clipper is non-convex!" << endl
              << "polygon: " << to_string(clipper) << endl
              << "clippee area: " << clippee_area << endl
              << "clipper area: " << clipper_area << endl;
-        return make_tuple(Polygons{}, Polygons{clippee});
+        outers.push_back(clippee);
+        return;
     }
 
-    auto inners = Polygons();
-    auto outers = Polygons();
-
     auto inner = clippee;
+    auto prev_inner = Polygon();
+    auto outer = Polygon();
     auto s1 = clipper.back();
     for (const auto &e1 : clipper)
     {
-        auto prev_inner = move(inner);
+        swap(prev_inner, inner);
         inner.clear();
-        auto outer = list<Point>();
+        outer.clear();
         auto s2 = prev_inner.back();
         for (const auto &e2 : prev_inner)
         {
@@ -222,7 +312,7 @@ tuple<Polygons, Polygons> clip(const Polygon &clippee, const Polygon &clipper) /
             {
                 if (left(e2, {s1, e1}))
                 {
-                    if (inner.back() != s2) // check bouncing
+                    if (inner.empty() || inner.back() != s2) // check bouncing
                     {
                         inner.push_back(s2);
                     }
@@ -234,7 +324,7 @@ tuple<Polygons, Polygons> clip(const Polygon &clippee, const Polygon &clipper) /
                 }
                 else // outside(e2)
                 {
-                    if (outer.back() != s2) // check bouncing
+                    if (outer.empty() || outer.back() != s2) // check bouncing
                     {
                         outer.push_back(s2);
                     }
@@ -289,15 +379,21 @@ tuple<Polygons, Polygons> clip(const Polygon &clippee, const Polygon &clipper) /
             abort();
         }
     }
+}
 
-    return make_tuple(inners, outers);
+tuple<Polygons, Polygons> clip(const Polygon &clippee, const Polygon &clipper) // inner, outer
+{
+    auto inners = Polygons();
+    auto outers = Polygons();
+    clip(clippee, clipper, inners, outers);
+    return make_tuple(move(inners), move(outers));
 }
 
 Polygons intersection(const Polygon &clippee, const Polygon &clipper)
 {
     auto inners = Polygons();
     auto outers = Polygons();
-    tie(inners, outers) = clip(clippee, clipper);
+    clip(clippee, clipper, inners, outers);
     assert(inners.size() < 2); // important
     return inners;
 }
@@ -305,11 +401,14 @@ Polygons intersection(const Polygon &clippee, const Polygon &clipper)
 Polygons intersection(Polygons clippees, const Polygons &clippers)
 {
     Polygons result;
+    auto inners = Polygons();
+    auto outers = Polygons();
     for (const auto &clipper : clippers)
     {
         for (auto &clippee : clippees)
         {
-            result.splice(result.end(), intersection(clippee, clipper));
+            clip(clippee, clipper, inners, outers);
+            move(inners.begin(), inners.end(), back_inserter(result));
         }
     }
     return result;
@@ -319,24 +418,45 @@ Polygons difference(const Polygon &clippee, const Polygon &clipper)
 {
     auto inners = Polygons();
     auto outers = Polygons();
-    tie(inners, outers) = clip(clippee, clipper);
+    clip(clippee, clipper, inners, outers);
     return outers;
 }
 
 Polygons difference(Polygons clippees, const Polygons &clippers)
 {
+    auto result = Polygons();
+    auto inners = Polygons();
+    auto outers = Polygons();
     for (const auto &clipper : clippers)
     {
-        Polygons result;
+        result.clear();
         for (auto &clippee : clippees)
         {
-            result.splice(result.end(), difference(clippee, clipper));
+            clip(clippee, clipper, inners, outers);
+            move(outers.begin(), outers.end(), back_inserter(result));
         }
-        clippees = move(result);
+        swap(clippees, result);
     }
     return clippees;
 }
 
+void difference(const Polygon &clippee, const Polygons &clippers, Polygons &result)
+{
+    thread_local Polygons clippees, inners, outers; // reused between calls to avoid allocation
+    result.clear();
+    result.push_back(clippee);
+    for (const auto &clipper : clippers)
+    {
+        swap(clippees, result);
+        result.clear();
+        for (const auto &piece : clippees)
+        {
+            clip(piece, clipper, inners, outers);
+            move(outers.begin(), outers.end(), back_inserter(result));
+        }
+    }
+}
+
 Polygon box(const Point &lower_left, const Point &upper_right)
 {
     return Polygon{lower_left, {upper_right.x, lower_left.y}, upper_right, {lower_left.x, upper_right.y}};
@@ -344,17 +464,28 @@ Polygon box(const Point &lower_left, const Point &upper_right)
 
 Polygon axis_aligned_bounding_box(const Polygon &polygon)
 {
-    double minx, miny, maxx, maxy;
-    minx = maxx = polygon.begin()->x;
-    miny = maxy = polygon.begin()->y;
+    auto bb = bounding_box(polygon);
+    return box({bb.minx, bb.miny}, {bb.maxx, bb.maxy});
+}
+
+BoundingBox bounding_box(const Polygon &polygon)
+{
+    BoundingBox bb;
+    bb.minx = bb.maxx = polygon.begin()->x;
+    bb.miny = bb.maxy = polygon.begin()->y;
     for (const auto &point : polygon)
     {
-        minx = min(minx, point.x);
-        miny = std::min(miny, point.y);
-        maxx = std::max(maxx, point.x);
-        maxy = std::max(maxy, point.y);
+        bb.minx = std::min(bb.minx, point.x);
+        bb.miny = std::min(bb.miny, point.y);
+        bb.maxx = std::max(bb.maxx, point.x);
+        bb.maxy = std::max(bb.maxy, point.y);
     }
-    return box({minx, miny}, {maxx, maxy});
+    return bb;
+}
+
+bool overlaps(const BoundingBox &a, const BoundingBox &b)
+{
+    return a.minx <= b.maxx && b.minx <= a.maxx && a.miny <= b.maxy && b.miny <= a.maxy;
 }
 
 #if 0
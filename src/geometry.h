@@ -1,27 +1,34 @@
 #ifndef CGSC_GEOMETRY_H
 #define CGSC_GEOMETRY_H
 
-#include <list>
+#include <vector>
 #include <string>
+#include <tuple>
 #include <functional>
 
 #include "vector2.hpp"
 #include "floats.hpp"
+#include "small_vector.hpp"
 
 using Point = vector2<double>;
-using Polygon = std::list<Point>;
+using Polygon = small_vector<Point, 8>; // scene footprints and their pieces rarely have more than 8 vertices
 using Triangle = Polygon;
-using Polygons = std::list<Polygon>;
+using Polygons = std::vector<Polygon>;
 
 struct Segment
 {
     Point a, b;
 };
 
+struct BoundingBox
+{
+    double minx, miny, maxx, maxy;
+};
+
 std::string to_string(const Polygon &poly);
 std::ostream &operator<<(std::ostream &os, const Polygon &poly);
 
-std::list<Point> parse_polygon(const std::string &s);
+Polygon parse_polygon(const std::string &s);
 double area(const Polygon &poly);
 bool left(const Point &p, const Segment &segment);
 bool right(const Point &p, const Segment &segment);
@@ -29,18 +36,24 @@ bool inside(const Point &p, const Polygon &poly);  // only for convex
 bool outside(const Point &p, const Polygon &poly); // only for convex
 bool crosses(const Polygon &a, const Polygon &b);
 bool disjoint(const Polygon &a, const Polygon &b);
-bool intersects(const Polygon &a, const Polygon &b);
+bool intersects(const Polygon &a, const Polygon &b); // same as intersection(a, b).size() > 0, false for a non-convex b
 bool convex(const Polygon &poly);
 
 Polygon box(const Point &lower_left, const Point &upper_right);
 Polygon axis_aligned_bounding_box(const Polygon &polygon);
+BoundingBox bounding_box(const Polygon &polygon);
+bool overlaps(const BoundingBox &a, const BoundingBox &b);
 
 // Following clip related functions only support non-closed polygon representation (i.e. first point != last point)
 // and convex clippers
+// The overloads taking output buffers clear them first, reusing the buffers avoids the allocation in hot loops
+// Pieces smaller than tolerance times the larger of the two areas are dropped, a tolerance of 0 keeps every piece
+void clip(const Polygon &clippee, const Polygon &clipper, Polygons &inners, Polygons &outers, double tolerance = 1e-6);
 std::tuple<Polygons, Polygons> clip(const Polygon &clippee, const Polygon &clipper);
 Polygons intersection(const Polygon &clippee, const Polygon &clipper);
 Polygons intersection(Polygons clippees, const Polygons &clipper);
 Polygons difference(const Polygon &clippee, const Polygon &clipper);
 Polygons difference(Polygons clippees, const Polygons &clipper);
+void difference(const Polygon &clippee, const Polygons &clippers, Polygons &result);
 
 #endif
\ No newline at end of file
@@ -37,6 +37,34 @@ double Stopwatch::lap() const
     return accumulation + (clock() - begin_time) * 1.0 / CLOCKS_PER_SEC;
 }
 
+WallStopwatch::WallStopwatch()
+{
+    restart();
+}
+
+void WallStopwatch::restart()
+{
+    accumulation = 0;
+    begin_time = chrono::steady_clock::now();
+}
+
+void WallStopwatch::pause()
+{
+    auto now = chrono::steady_clock::now();
+    accumulation += chrono::duration<double>(now - begin_time).count();
+    begin_time = now; // make lap still work after pause before continue
+}
+
+void WallStopwatch::continue_()
+{
+    begin_time = chrono::steady_clock::now();
+}
+
+double WallStopwatch::lap() const
+{
+    return accumulation + chrono::duration<double>(chrono::steady_clock::now() - begin_time).count();
+}
+
 list<string> split(string s, const string &delimiter)
 {
     auto ret = list<string>();
@@ -7,6 +7,7 @@
 #include <string>
 #include <map>
 #include <ctime>
+#include <chrono>
 #include <sstream>
 #include <iomanip>
 #include <iostream>
@@ -16,6 +17,7 @@
 
 #include "json.hpp"
 
+// Measures the CPU time of the process with clock(), the time of all its threads adds up
 class Stopwatch
 {
 public:
@@ -30,6 +32,22 @@ private:
   double accumulation;
 };
 
+// Measures wall-clock time, it is not affected by the other threads or by system clock changes. The deadlines of the
+// searches are in wall seconds.
+class WallStopwatch
+{
+public:
+  WallStopwatch();
+  void restart();
+  double lap() const;
+  void pause();
+  void continue_();
+
+private:
+  std::chrono::steady_clock::time_point begin_time;
+  double accumulation;
+};
+
 namespace func
 {
 template <class T,
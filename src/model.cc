@@ -2,30 +2,97 @@
 
 #include <iostream>
 #include <fstream>
-#include <set>
+#include <algorithm>
 
 using namespace std;
 
-bool operator==(const Element &a, const Element &b)
+Incidence::Ids Incidence::elements_of(int range) const
 {
-    return a.id == b.id;
+    return Ids{range_elements.data() + range_offsets[range], range_elements.data() + range_offsets[range + 1]};
 }
 
-bool operator<(const Element &a, const Element &b)
+Incidence::Ids Incidence::ranges_of(int element) const
 {
-    return a.id < b.id;
+    return Ids{element_ranges.data() + element_offsets[element], element_ranges.data() + element_offsets[element + 1]};
 }
 
-void Set::update_value()
+int IncidenceBuilder::add_element(double value)
 {
-    value = func::sum(elements, [](const Element &element) {
-        return element.value;
-    });
+    values.push_back(value);
+    return values.size() - 1;
+}
+
+void IncidenceBuilder::add(int range, int element)
+{
+    pairs.emplace_back(range, element);
+}
+
+double IncidenceBuilder::total_value() const
+{
+    return func::sum(values, func::identity<double>);
+}
+
+Incidence IncidenceBuilder::build(int number_of_ranges)
+{
+    sort(pairs.begin(), pairs.end());
+    pairs.erase(unique(pairs.begin(), pairs.end()), pairs.end());
+
+    auto incidence = Incidence();
+    incidence.values = move(values);
+    int number_of_elements = incidence.values.size();
+
+    // pairs are sorted by range then element, which is already the row layout
+    incidence.range_offsets.assign(number_of_ranges + 1, 0);
+    incidence.range_elements.reserve(pairs.size());
+    for (const auto &pair : pairs)
+    {
+        ++incidence.range_offsets[pair.first + 1];
+        incidence.range_elements.push_back(pair.second);
+    }
+    for (int r = 0; r < number_of_ranges; ++r)
+    {
+        incidence.range_offsets[r + 1] += incidence.range_offsets[r];
+    }
+
+    // counting sort by element for the inverse, ranges stay ascending since pairs are visited in range order
+    incidence.element_offsets.assign(number_of_elements + 1, 0);
+    for (const auto &pair : pairs)
+    {
+        ++incidence.element_offsets[pair.second + 1];
+    }
+    for (int e = 0; e < number_of_elements; ++e)
+    {
+        incidence.element_offsets[e + 1] += incidence.element_offsets[e];
+    }
+    incidence.element_ranges.resize(pairs.size());
+    auto cursors = vector<int>(incidence.element_offsets.begin(), incidence.element_offsets.end() - 1);
+    for (const auto &pair : pairs)
+    {
+        incidence.element_ranges[cursors[pair.second]++] = pair.first;
+    }
+
+    values.clear();
+    pairs.clear();
+    return incidence;
 }
 
 Set::~Set() {}
 
+void Universe::update_value()
+{
+    value = func::sum(incidence.values, func::identity<double>);
+}
+
 void Range::update_cost()
 {
     cost = product->price;
 }
+
+void Range::update_value(const Incidence &incidence)
+{
+    value = 0;
+    for (auto element : incidence.elements_of(id))
+    {
+        value += incidence.values[element];
+    }
+}
@@ -2,8 +2,8 @@
 #define CGSC_MODEL_H
 
 #include <functional>
-#include <unordered_set>
-#include <set>
+#include <vector>
+#include <utility>
 
 #include "json.hpp"
 
@@ -18,55 +18,74 @@ struct Roi
 
 struct Product
 {
-    Product(Polygon polygon, double price) : polygon(std::move(polygon)), price(price) {}
+    Product(Polygon polygon, double price, int id = -1) : polygon(std::move(polygon)), price(price), id(id) {}
     Polygon polygon;
     double price;
+    int id; // position in the archive, kept by the cropped copies, -1 when unknown
 };
 
 using Rois = std::vector<Roi>;
 using Products = std::vector<Product>;
 
-struct Element // element of set cover problem
+// Elements of the set cover problem are identified by ids 0..n-1 and ranges by their positions in Ranges.
+// The instance is stored in compressed sparse row form, range -> elements, with the element -> ranges
+// inverse and the dense element values. Transformers build it once, optimizers only read it.
+struct Incidence
 {
-    int id;
-    double value;
-};
+    struct Ids // contiguous run of ids, in ascending order
+    {
+        const int *first, *last;
+        const int *begin() const { return first; }
+        const int *end() const { return last; }
+        int size() const { return last - first; }
+    };
 
-bool operator==(const Element &a, const Element &b);
-bool operator<(const Element &a, const Element &b);
+    std::vector<double> values;       // value of each element
+    std::vector<int> range_offsets;   // elements of range r are range_elements[range_offsets[r]:range_offsets[r + 1]]
+    std::vector<int> range_elements;
+    std::vector<int> element_offsets; // ranges of element e are element_ranges[element_offsets[e]:element_offsets[e + 1]]
+    std::vector<int> element_ranges;
 
-namespace std
-{
-template <>
-struct hash<Element>
+    int number_of_elements() const { return values.size(); }
+    int number_of_ranges() const { return range_offsets.empty() ? 0 : range_offsets.size() - 1; }
+    Ids elements_of(int range) const;
+    Ids ranges_of(int element) const;
+};
+
+class IncidenceBuilder
 {
-    using argument_type = Element;
-    using result_type = std::size_t;
-    result_type operator()(argument_type const &element) const noexcept
-    {
-        return element.id;
-    }
+public:
+  int add_element(double value); // returns the id of the new element
+  void add(int range, int element);
+  double total_value() const;
+  int number_of_elements() const { return values.size(); }
+  Incidence build(int number_of_ranges); // duplicated (range, element) pairs are counted once
+
+private:
+  std::vector<double> values;
+  std::vector<std::pair<int, int>> pairs; // (range, element)
 };
-}
 
 struct Set
 {
-    std::unordered_set<Element> elements;
     double value;
-    virtual void update_value();
     virtual ~Set();
 };
 
 struct Universe : Set
 {
     const Roi *roi;
+    Incidence incidence;
+    void update_value();
 };
 
 struct Range : Set
 {
     const Product *product;
     double cost;
+    int id; // row in the incidence
     void update_cost();
+    void update_value(const Incidence &incidence);
 };
 
 using Ranges = std::vector<Range>;
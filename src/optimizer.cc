@@ -2,6 +2,9 @@
 
 #include <queue>
 #include <limits>
+#include <stdexcept>
+
+#include "bnb.h"
 
 using namespace std;
 using nlohmann::json;
@@ -12,6 +15,20 @@ Optimizer::Optimizer(double target_coverage) : target_coverage(target_coverage)
 
 Optimizer::~Optimizer() {}
 
+// value of the elements of the range that are not covered yet
+static double uncovered_value(const Incidence &incidence, int range_id, const vector<bool> &covered)
+{
+    double value = 0;
+    for (auto element : incidence.elements_of(range_id))
+    {
+        if (!covered[element])
+        {
+            value += incidence.values[element];
+        }
+    }
+    return value;
+}
+
 GreedyOptimizer::GreedyOptimizer(double target_coverage) : Optimizer(target_coverage)
 {
 }
@@ -21,38 +38,53 @@ json GreedyOptimizer::optimize(const Universe &universe, const Ranges &ranges, R
     report.clear();
     struct Pair
     {
-        Range range;
-        const Range *original_range;
+        int index; // position in ranges
+        double value;
     };
+    const auto &incidence = universe.incidence;
     result_ranges.clear();
     double current_value = 0;
     double target_value = universe.value * target_coverage;
-    auto pairs = func::map(ranges, [](const auto &range) {
-        return Pair{range, &range};
-    });
+    auto pairs = vector<Pair>();
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        pairs.push_back(Pair{i, ranges[i].value});
+    }
+    auto covered = vector<bool>(incidence.number_of_elements(), false);
+    auto dirty = vector<bool>(incidence.number_of_ranges(), false);
     while (current_value < target_value && pairs.size() > 0) // n
     {
-        auto it = func::min_element(pairs, [](const Pair &pair) { // n
-            return pair.range.cost / pair.range.value;
+        auto it = func::min_element(pairs, [&ranges](const Pair &pair) { // n
+            return ranges[pair.index].cost / pair.value;
         });
-        auto current_range = move(it->range);
-        result_ranges.push_back(*it->original_range);
+        const auto &current_range = ranges[it->index];
+        result_ranges.push_back(current_range);
+        current_value += it->value;
         pairs.erase(it);
 
-        current_value += current_range.value;
-        for (auto &pair : pairs)
+        // only the ranges sharing a newly covered element lose value
+        for (auto element : incidence.elements_of(current_range.id)) // m
         {
-            if (intersects(pair.range.product->polygon, current_range.product->polygon))
+            if (!covered[element])
             {
-                for (const auto &element : current_range.elements) // m
+                covered[element] = true;
+                for (auto range_id : incidence.ranges_of(element))
                 {
-                    pair.range.elements.erase(element); // 1
+                    dirty[range_id] = true;
                 }
-                pair.range.update_value();
+            }
+        }
+        for (auto &pair : pairs)
+        {
+            int range_id = ranges[pair.index].id;
+            if (dirty[range_id])
+            {
+                pair.value = uncovered_value(incidence, range_id, covered);
+                dirty[range_id] = false;
             }
         }
         pairs = func::filter(pairs, [](const Pair &pair) {
-            return pair.range.value > 0;
+            return pair.value > 0;
         });
         // cout << current_value * 100.0 / universe.value << "%: " << pairs.size() << endl;
     }
@@ -64,6 +96,333 @@ json GreedyOptimizer::optimize(const Universe &universe, const Ranges &ranges, R
     return report;
 }
 
+LazyGreedyOptimizer::LazyGreedyOptimizer(double target_coverage) : Optimizer(target_coverage)
+{
+}
+
+json LazyGreedyOptimizer::optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const
+{
+    report.clear();
+    struct Pair
+    {
+        double ratio; // cost / value, a lower bound of the actual ratio once the range is stale
+        int index;    // position in ranges, breaks ties like the scan of GreedyOptimizer
+        double value;
+        bool operator>(const Pair &other) const
+        {
+            return ratio > other.ratio || (ratio == other.ratio && index > other.index);
+        }
+    };
+    const auto &incidence = universe.incidence;
+    result_ranges.clear();
+    double current_value = 0;
+    double target_value = universe.value * target_coverage;
+    auto heap = priority_queue<Pair, vector<Pair>, greater<Pair>>();
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        if (ranges[i].value > 0)
+        {
+            heap.push(Pair{ranges[i].cost / ranges[i].value, i, ranges[i].value});
+        }
+    }
+    auto covered = vector<bool>(incidence.number_of_elements(), false);
+    auto stale = vector<bool>(incidence.number_of_ranges(), false);
+    int number_of_evaluations = 0;
+    while (current_value < target_value && !heap.empty())
+    {
+        auto pair = heap.top();
+        heap.pop();
+        const auto &range = ranges[pair.index];
+        if (stale[range.id])
+        {
+            // values only decrease, so a re-evaluated pair goes back behind the pairs it may have passed
+            stale[range.id] = false;
+            pair.value = uncovered_value(incidence, range.id, covered);
+            pair.ratio = range.cost / pair.value;
+            ++number_of_evaluations;
+            if (pair.value > 0)
+            {
+                heap.push(pair);
+            }
+            continue;
+        }
+
+        result_ranges.push_back(range);
+        current_value += pair.value;
+        for (auto element : incidence.elements_of(range.id))
+        {
+            if (!covered[element])
+            {
+                covered[element] = true;
+                for (auto range_id : incidence.ranges_of(element))
+                {
+                    stale[range_id] = true;
+                }
+            }
+        }
+    }
+    if (current_value < target_value)
+    {
+        result_ranges.clear();
+    }
+    report["actual_coverage"] = current_value / universe.value;
+    report["number_of_evaluations"] = number_of_evaluations;
+    return report;
+}
+
+LagrangianOptimizer::LagrangianOptimizer(double target_coverage, int max_iterations)
+    : Optimizer(target_coverage), max_iterations(max_iterations)
+{
+    if (max_iterations < 1)
+    {
+        throw invalid_argument("max_iterations should be at least 1");
+    }
+}
+
+// Repairs a selection into a cover: the cheapest ranges per uncovered value are added until the target is reached,
+// then the ranges not needed any more are removed from the most expensive. Returns the cost of the cover, or max
+static double repair(const Incidence &incidence, const Ranges &ranges, double target_value, vector<bool> &selected)
+{
+    struct Pair
+    {
+        double ratio;
+        int index;
+        double value;
+        bool operator>(const Pair &other) const
+        {
+            return ratio > other.ratio || (ratio == other.ratio && index > other.index);
+        }
+    };
+    auto counts = vector<int>(incidence.number_of_elements(), 0); // the selected ranges holding each element
+    double value = 0;
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        if (selected[i])
+        {
+            for (auto element : incidence.elements_of(ranges[i].id))
+            {
+                value += counts[element]++ == 0 ? incidence.values[element] : 0;
+            }
+        }
+    }
+
+    auto covered = [&](int element) { return counts[element] > 0; };
+    auto uncovered_value = [&](int i) {
+        double uncovered = 0;
+        for (auto element : incidence.elements_of(ranges[i].id))
+        {
+            uncovered += covered(element) ? 0 : incidence.values[element];
+        }
+        return uncovered;
+    };
+    auto heap = priority_queue<Pair, vector<Pair>, greater<Pair>>();
+    for (int i = 0; i < ranges.size() && value < target_value; ++i)
+    {
+        double uncovered = selected[i] ? 0 : uncovered_value(i);
+        if (uncovered > 0)
+        {
+            heap.push(Pair{ranges[i].cost / uncovered, i, uncovered});
+        }
+    }
+    while (value < target_value && !heap.empty())
+    {
+        auto pair = heap.top();
+        heap.pop();
+        double uncovered = uncovered_value(pair.index);
+        if (uncovered != pair.value) // stale, values only decrease
+        {
+            if (uncovered > 0)
+            {
+                heap.push(Pair{ranges[pair.index].cost / uncovered, pair.index, uncovered});
+            }
+            continue;
+        }
+        selected[pair.index] = true;
+        for (auto element : incidence.elements_of(ranges[pair.index].id))
+        {
+            value += counts[element]++ == 0 ? incidence.values[element] : 0;
+        }
+    }
+    if (value < target_value)
+    {
+        return numeric_limits<double>::max();
+    }
+
+    auto by_cost = vector<int>();
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        if (selected[i])
+        {
+            by_cost.push_back(i);
+        }
+    }
+    sort(by_cost.begin(), by_cost.end(), [&ranges](int a, int b) { return ranges[a].cost > ranges[b].cost; });
+    double cost = 0;
+    for (auto i : by_cost)
+    {
+        double lost = 0; // the value only this range covers
+        for (auto element : incidence.elements_of(ranges[i].id))
+        {
+            lost += counts[element] == 1 ? incidence.values[element] : 0;
+        }
+        if (value - lost >= target_value)
+        {
+            selected[i] = false;
+            value -= lost;
+            for (auto element : incidence.elements_of(ranges[i].id))
+            {
+                --counts[element];
+            }
+        }
+        else
+        {
+            cost += ranges[i].cost;
+        }
+    }
+    return cost;
+}
+
+json LagrangianOptimizer::optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const
+{
+    report.clear();
+    const auto &incidence = universe.incidence;
+    const auto &values = incidence.values;
+    double target_value = universe.value * target_coverage;
+
+    // the multiplier of an element prices its coverage, it starts at the lowest unit cost of the ranges holding it
+    auto multipliers = vector<double>(incidence.number_of_elements(), numeric_limits<double>::max());
+    for (const auto &range : ranges)
+    {
+        if (range.value <= 0)
+        {
+            continue;
+        }
+        for (auto element : incidence.elements_of(range.id))
+        {
+            multipliers[element] = min(multipliers[element], range.cost / range.value * values[element]);
+        }
+    }
+    auto elements = vector<int>(); // the elements some range holds, the others cannot be covered
+    for (int element = 0; element < incidence.number_of_elements(); ++element)
+    {
+        if (multipliers[element] != numeric_limits<double>::max() && values[element] > 0)
+        {
+            elements.push_back(element);
+        }
+    }
+
+    const int patience = 20; // iterations without a better dual value before the step is halved
+    double step_scale = 2;
+    int since_improvement = 0;
+    double lower_bound = 0, upper_bound = numeric_limits<double>::max();
+    auto best_selection = vector<bool>();
+    auto selected = vector<bool>(ranges.size());
+    auto subgradient = vector<double>(incidence.number_of_elements(), 0);
+    int iteration = 0;
+    while (iteration < max_iterations)
+    {
+        ++iteration;
+        // the Lagrangian solution selects the ranges of negative reduced cost, and buys the target value from the
+        // elements with the lowest multiplier per value, fractionally, which keeps it a lower bound
+        double lagrangian = 0;
+        for (int i = 0; i < ranges.size(); ++i)
+        {
+            double reduced_cost = ranges[i].cost;
+            for (auto element : incidence.elements_of(ranges[i].id))
+            {
+                reduced_cost -= multipliers[element];
+            }
+            selected[i] = reduced_cost < 0;
+            lagrangian += min(reduced_cost, 0.0);
+        }
+        sort(elements.begin(), elements.end(), [&](int a, int b) {
+            return multipliers[a] / values[a] < multipliers[b] / values[b];
+        });
+        double deficit = target_value;
+        for (auto element : elements)
+        {
+            double bought = deficit > 0 ? min(1.0, deficit / values[element]) : 0;
+            lagrangian += multipliers[element] * bought;
+            deficit -= bought * values[element];
+            subgradient[element] = bought;
+        }
+        if (deficit > 1e-9 * target_value) // the target cannot be reached
+        {
+            break;
+        }
+        for (int i = 0; i < ranges.size(); ++i)
+        {
+            if (selected[i])
+            {
+                for (auto element : incidence.elements_of(ranges[i].id))
+                {
+                    subgradient[element] -= 1;
+                }
+            }
+        }
+
+        if (lagrangian > lower_bound)
+        {
+            lower_bound = lagrangian;
+            since_improvement = 0;
+        }
+        else if (++since_improvement == patience)
+        {
+            step_scale /= 2;
+            since_improvement = 0;
+        }
+        double cost = repair(incidence, ranges, target_value, selected);
+        if (cost < upper_bound)
+        {
+            upper_bound = cost;
+            best_selection = selected;
+        }
+
+        double norm = func::sum(elements, [&subgradient](int element) { return subgradient[element] * subgradient[element]; });
+        if (upper_bound - lower_bound <= 1e-9 * upper_bound || norm == 0 || step_scale < 1e-3)
+        {
+            break;
+        }
+        double step = step_scale * (upper_bound - lagrangian) / norm;
+        for (auto element : elements)
+        {
+            multipliers[element] = max(0.0, multipliers[element] + step * subgradient[element]);
+        }
+    }
+
+    result_ranges.clear();
+    if (upper_bound != numeric_limits<double>::max())
+    {
+        double value = 0;
+        auto covered = vector<bool>(incidence.number_of_elements(), false);
+        for (int i = 0; i < ranges.size(); ++i)
+        {
+            if (best_selection[i])
+            {
+                result_ranges.push_back(ranges[i]);
+                value += uncovered_value(incidence, ranges[i].id, covered);
+                for (auto element : incidence.elements_of(ranges[i].id))
+                {
+                    covered[element] = true;
+                }
+            }
+        }
+        report["actual_coverage"] = value / universe.value;
+        report["lower_bound"] = lower_bound;
+        report["gap"] = (upper_bound - lower_bound) / upper_bound;
+    }
+    report["number_of_iterations"] = iteration;
+    return report;
+}
+
+// What the nodes of a search refer to, each search has its own
+struct SearchContext
+{
+    double target_value;
+    const Universe *universe;
+    vector<Range> ranges;
+};
+
 struct BaseNode
 {
     double cost = 0;  // the cost of selected ranges
@@ -72,9 +431,7 @@ struct BaseNode
     double cost_lower_bound = 0;
     vector<int> selected;
 
-    static double target_value;
-    static const Universe *universe;
-    static vector<Range> ranges;
+    shared_ptr<const SearchContext> context;
 
     virtual shared_ptr<BaseNode> clone() = 0;
     virtual void update_value() = 0;
@@ -87,7 +444,7 @@ struct BaseNode
     void select_next()
     {
         selected.push_back(cursor);
-        cost += ranges[cursor].cost;
+        cost += context->ranges[cursor].cost;
         update_value();
         ++cursor;
     }
@@ -114,12 +471,12 @@ struct BaseNode
 
     virtual nlohmann::json describe()
     {
-        assert(universe != nullptr);
+        assert(context != nullptr);
         return nlohmann::json{
             {"cost", cost},
-            {"to_select.size()", ranges.size() - cursor},
+            {"to_select.size()", context->ranges.size() - cursor},
             {"selected.size()", selected.size()},
-            {"coverage_ratio", value / universe->value},
+            {"coverage_ratio", value / context->universe->value},
             {"cost lower bound", cost_lower_bound},
         };
     }
@@ -132,27 +489,24 @@ struct BaseNode
     }
 };
 
-double BaseNode::target_value = 0;
-const Universe *BaseNode::universe = nullptr;
-vector<Range> BaseNode::ranges;
-
 template <class Node>
 void branch_and_bound(const Universe &universe,
                       const Ranges &ranges,
                       Ranges &result_ranges,
-                      double target_coverage,
-                      json &report)
+                      double target_coverage)
 {
     auto sw = Stopwatch(); // timer
-    Node::ranges = ranges;
-    sort(Node::ranges.begin(), Node::ranges.end(), [](const Range &a, const Range &b) { // unit cost from lower to higher
+    auto context = make_shared<SearchContext>();
+    context->ranges = ranges;
+    sort(context->ranges.begin(), context->ranges.end(), [](const Range &a, const Range &b) { // unit cost from lower to higher
         return a.cost / a.value < b.cost / b.value;
     });
-    Node::target_value = universe.value * target_coverage;
-    Node::universe = &universe;
+    context->target_value = universe.value * target_coverage;
+    context->universe = &universe;
 
     shared_ptr<BaseNode> optimal_node = make_shared<Node>();
     {
+        optimal_node->context = context;
         optimal_node->cost = numeric_limits<double>::max();
         // auto greedy_optimizer = GreedyOptimizer(target_coverage);
         // greedy_optimizer.optimize(universe, ranges, result_ranges);
@@ -167,6 +521,7 @@ void branch_and_bound(const Universe &universe,
 
     shared_ptr<BaseNode> initial_node = make_shared<Node>();
     {
+        initial_node->context = context;
         initial_node->cost = 0;
         initial_node->value = 0;
         initial_node->cursor = 0;
@@ -206,7 +561,7 @@ void branch_and_bound(const Universe &universe,
         // report.push_back(desc);
         sw.continue_();
 
-        if (node->value >= Node::target_value)
+        if (node->value >= context->target_value)
         {
             if (node->cost < optimal_node->cost) // lower cost, great
             {
@@ -214,7 +569,7 @@ void branch_and_bound(const Universe &universe,
                 optimal_node->print("better solution");
             }
         }
-        else if (node->cursor != Node::ranges.size())
+        else if (node->cursor != context->ranges.size())
         {
             auto new_nodes = node->branch();
             for (auto new_node : new_nodes)
@@ -246,95 +601,58 @@ void branch_and_bound(const Universe &universe,
         result_ranges.clear();
         for (auto selected : optimal_node->selected)
         {
-            result_ranges.push_back(BaseNode::ranges[selected]);
+            result_ranges.push_back(context->ranges[selected]);
         }
     }
 }
 
-BnbOptimizer::BnbOptimizer(double target_coverage) : Optimizer(target_coverage)
+BnbOptimizer::BnbOptimizer(double target_coverage, const BnbOptions &options)
+    : Optimizer(target_coverage), options(options)
 {
+    if (options.search != "best_first" && options.search != "dfs")
+    {
+        throw invalid_argument("unknown search: " + options.search);
+    }
+    if (options.bound != "claims" && options.bound != "lp")
+    {
+        throw invalid_argument("unknown bound: " + options.bound);
+    }
+    if (options.gap < 0 || options.gap >= 1)
+    {
+        throw invalid_argument("gap should be in [0, 1)");
+    }
+    if (options.threads < 1)
+    {
+        throw invalid_argument("threads should be at least 1");
+    }
+    if (options.memory_budget < 0)
+    {
+        throw invalid_argument("memory_budget should not be negative");
+    }
 }
 
 json BnbOptimizer::optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const
 {
     report.clear();
-    struct Node : public BaseNode
+    auto problem = BnbProblem(universe, ranges, target_coverage);
+    auto selection = vector<int>();
+    if (options.search == "dfs")
     {
-        vector<bool> visited;
-
-        Node() : BaseNode()
-        {
-            visited.resize(universe->elements.size(), false);
-        }
-
-        shared_ptr<BaseNode> clone()
-        {
-            return make_shared<Node>(*this);
-        }
-
-        void update_value()
-        {
-            assert(universe->elements.size() == visited.size() && "visited should be initialized");
-            for (const auto &element : ranges[cursor].elements)
-            {
-                if (visited[element.id] == 0)
-                {
-                    visited[element.id] = 1;
-                    value += element.value;
-                }
-            }
-        }
-
-        void bound()
-        {
-            assert(universe->elements.size() == visited.size() && "visited should be initialized");
-            cost_lower_bound = cost;
-            double current_value = value;
-            auto visited_copy = visited;
-            for (int i = cursor; i < ranges.size(); ++i)
-            {
-                const auto &range = ranges[i];
-
-                for (const auto &element : range.elements) // k
-                {
-                    if (visited_copy[element.id] == 0)
-                    {
-                        double deficit = target_value - current_value;
-                        if (element.value > deficit)
-                        {
-                            cost_lower_bound += range.cost / range.value * deficit;
-                            current_value += deficit;
-                            return;
-                        }
-                        else
-                        {
-                            cost_lower_bound += range.cost / range.value * element.value;
-                            current_value += element.value;
-                        }
-                        visited_copy[element.id] = 1;
-                    }
-                }
-            }
-            if (current_value < target_value)
-            {
-                cost_lower_bound = numeric_limits<double>::max();
-            }
-        }
-
-        json describe()
-        {
-            int n_visited = 0;
-            for (int i = 0; i < visited.size(); ++i)
-            {
-                n_visited += visited[i];
-            }
-            auto ret = BaseNode::describe();
-            ret["visited.size()"] = n_visited;
-            return ret;
-        }
-    };
-
-    branch_and_bound<Node>(universe, ranges, result_ranges, target_coverage, report);
+        selection = depth_first_search(problem, options, report);
+    }
+    else if (options.threads > 1)
+    {
+        selection = parallel_best_first_search(problem, options, report);
+    }
+    else
+    {
+        selection = best_first_search(problem, options, report);
+    }
+    result_ranges.clear();
+    for (auto i : selection)
+    {
+        result_ranges.push_back(problem.ranges[i]);
+    }
     return report;
 }
 
@@ -347,7 +665,7 @@ json OnlineBnbOptimizer::optimize(const Universe &universe, const Ranges &ranges
     report.clear();
     struct Node : BaseNode
     {
-        list<Polygon> offcuts;
+        Polygons offcuts;
 
         shared_ptr<BaseNode> clone()
         {
@@ -356,36 +674,35 @@ json OnlineBnbOptimizer::optimize(const Universe &universe, const Ranges &ranges
 
         void update_value()
         {
-            assert(cursor < ranges.size() && "cursor out of ranges!");
+            assert(cursor < context->ranges.size() && "cursor out of ranges!");
             // offcuts & covered
-            offcuts = difference(offcuts, {ranges[cursor].product->polygon});
+            offcuts = difference(offcuts, {context->ranges[cursor].product->polygon});
             // deficit area
-            value = universe->value - func::sum(offcuts, area);
+            value = context->universe->value - func::sum(offcuts, area);
         }
 
         void bound()
         {
             cost_lower_bound = cost;
             auto left_offcuts = offcuts;
+            auto inners = Polygons();
+            auto outers = Polygons();
             double current_value = value;
-            for (int i = cursor; i < ranges.size(); ++i)
+            for (int i = cursor; i < context->ranges.size(); ++i)
             {
-                for (auto it = left_offcuts.begin(); it != left_offcuts.end();)
+                const auto &range = context->ranges[i];
+                auto scene_offcuts = intersection(context->universe->roi->polygon, range.product->polygon);
+                if (scene_offcuts.size() == 0) // no intersection
+                    continue;
+                const auto &scene_offcut = scene_offcuts.front();
+                for (int k = 0; k < left_offcuts.size();) // the outers appended are also visited
                 {
-                    const auto &range = ranges[i];
-                    auto scene_offcuts = intersection(universe->roi->polygon, range.product->polygon);
-                    if (scene_offcuts.size() == 0) // no intersection
-                        continue;
-                    auto scene_offcut = scene_offcuts.front();
-                    const auto &left_offcut = *it;
-                    auto inners = list<Polygon>();
-                    auto outers = list<Polygon>();
-                    tie(inners, outers) = clip(left_offcut, scene_offcut);
+                    clip(left_offcuts[k], scene_offcut, inners, outers);
                     if (inners.size() > 0) // intersects
                     {
                         for (const auto &inner : inners)
                         {
-                            double deficit = target_value - current_value;
+                            double deficit = context->target_value - current_value;
                             double inner_area = area(inner);
                             if (deficit <= inner_area)
                             {
@@ -403,15 +720,15 @@ json OnlineBnbOptimizer::optimize(const Universe &universe, const Ranges &ranges
                         {
                             left_offcuts.push_back(outer);
                         }
-                        it = left_offcuts.erase(it);
+                        left_offcuts.erase(left_offcuts.begin() + k);
                     }
                     else
                     {
-                        ++it;
+                        ++k;
                     }
                 }
             }
-            if (current_value < target_value) // the optimistic value is not able to covered the whole scene
+            if (current_value < context->target_value) // the optimistic value is not able to covered the whole scene
             {
                 cost_lower_bound = numeric_limits<double>::max();
             }
@@ -424,6 +741,6 @@ json OnlineBnbOptimizer::optimize(const Universe &universe, const Ranges &ranges
             return ret;
         }
     };
-    branch_and_bound<Node>(universe, ranges, result_ranges, target_coverage, report);
+    branch_and_bound<Node>(universe, ranges, result_ranges, target_coverage);
     return report;
 }
\ No newline at end of file
@@ -1,6 +1,8 @@
 #ifndef CGSC_OPTIMIZER_H
 #define CGSC_OPTIMIZER_H
 
+#include <memory>
+
 #include "model.h"
 
 class Optimizer
@@ -9,6 +11,9 @@ public:
   Optimizer(double target_coverage);
   virtual nlohmann::json optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const = 0;
   virtual std::string tag() const = 0;
+  double target() const { return target_coverage; }
+  // the same optimizer, with the same options, for another target
+  virtual std::shared_ptr<Optimizer> with_target(double target_coverage) const = 0;
   virtual ~Optimizer();
 protected:
   double target_coverage; // 0 ~ 1, acceptable value / Universe value
@@ -21,14 +26,57 @@ public:
   GreedyOptimizer(double target_coverage);
   nlohmann::json optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const;
   std::string tag() const { return "greedy"; };
+  std::shared_ptr<Optimizer> with_target(double target_coverage) const { return std::make_shared<GreedyOptimizer>(target_coverage); }
+};
+
+// Same selection as GreedyOptimizer, the ratios are kept in a heap and only re-evaluated when popped
+class LazyGreedyOptimizer : public Optimizer
+{
+public:
+  LazyGreedyOptimizer(double target_coverage);
+  nlohmann::json optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const;
+  std::string tag() const { return "lazy_greedy"; };
+  std::shared_ptr<Optimizer> with_target(double target_coverage) const { return std::make_shared<LazyGreedyOptimizer>(target_coverage); }
+};
+
+// Subgradient optimization of the Lagrangian dual of the partial cover, where the coverage of every element by its
+// ranges is relaxed. Every Lagrangian solution is repaired greedily into a cover, the cheapest one is returned and the
+// best dual value certifies its gap
+class LagrangianOptimizer : public Optimizer
+{
+public:
+  LagrangianOptimizer(double target_coverage, int max_iterations = 500);
+  nlohmann::json optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const;
+  std::string tag() const { return "lagrangian"; };
+  std::shared_ptr<Optimizer> with_target(double target_coverage) const { return std::make_shared<LagrangianOptimizer>(target_coverage, max_iterations); }
+
+private:
+  int max_iterations;
+};
+
+struct BnbOptions
+{
+  std::string search = "best_first"; // best_first, or dfs to dive with a single coverage that is applied and undone
+  std::string bound = "claims";      // claims, or lp to tighten the nodes not pruned by it with the LP relaxation
+  double deadline = 200;             // wall seconds, the search stops and returns its incumbent after it
+  double gap = 0;                    // relative optimality gap, nodes bounded above (1 - gap) * incumbent are pruned
+  int threads = 1;                   // workers of the best-first search, they share sharded queues
+  bool greedy_seed = true;           // the greedy solution is the first incumbent
+  int completion_interval = 1000;    // every so many nodes the node is completed greedily into an incumbent, 0 disables
+  double memory_budget = 0;          // megabytes of nodes kept by the sequential best-first search, 0 is unlimited.
+                                     // Over it, the best nodes are explored depth-first instead of expanded
 };
 
 class BnbOptimizer : public Optimizer
 {
 public:
-  BnbOptimizer(double target_coverage);
+  BnbOptimizer(double target_coverage, const BnbOptions &options = BnbOptions());
   nlohmann::json optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const;
   std::string tag() const { return "bnb"; }
+  std::shared_ptr<Optimizer> with_target(double target_coverage) const { return std::make_shared<BnbOptimizer>(target_coverage, options); }
+
+private:
+  BnbOptions options;
 };
 
 class OnlineBnbOptimizer : public Optimizer
@@ -37,6 +85,7 @@ public:
   OnlineBnbOptimizer(double target_coverage);
   nlohmann::json optimize(const Universe &universe, const Ranges &ranges, Ranges &result_ranges) const;
   std::string tag() const { return "old_bnb"; }
+  std::shared_ptr<Optimizer> with_target(double target_coverage) const { return std::make_shared<OnlineBnbOptimizer>(target_coverage); }
 };
 
 #endif
\ No newline at end of file
@@ -0,0 +1,311 @@
+#include "raster_cache.h"
+
+#include <algorithm>
+#include <cstring>
+#include <memory>
+#include <stdexcept>
+
+#include <fcntl.h>
+#include <sys/file.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+using namespace std;
+using nlohmann::json;
+
+namespace
+{
+const char magic[8] = {'C', 'G', 'S', 'C', 'C', 'E', 'L', 'L'};
+// magic, delta, number of products, fingerprint of the archive
+const size_t header_size = sizeof(magic) + sizeof(double) + 2 * sizeof(uint64_t);
+// product id, number of cells, checksum of the record, the cells stay aligned on 8 bytes
+const size_t record_header_size = sizeof(int32_t) + sizeof(uint32_t) + sizeof(uint64_t);
+
+// FNV-1a, over the bytes of the data
+uint64_t hash(const void *data, size_t size, uint64_t seed = 14695981039346656037ull)
+{
+    auto bytes = static_cast<const unsigned char *>(data);
+    for (size_t i = 0; i < size; ++i)
+    {
+        seed = (seed ^ bytes[i]) * 1099511628211ull;
+    }
+    return seed;
+}
+
+// the cells of a product only hold for the archive they were rasterized from
+uint64_t fingerprint(const Products &products)
+{
+    auto ret = hash(nullptr, 0);
+    for (const auto &product : products)
+    {
+        for (const auto &point : product.polygon)
+        {
+            ret = hash(&point.x, sizeof(point.x), ret);
+            ret = hash(&point.y, sizeof(point.y), ret);
+        }
+        ret = hash(&product.price, sizeof(product.price), ret);
+    }
+    return ret;
+}
+
+uint64_t checksum(int32_t product_id, uint32_t number_of_cells, const uint64_t *cells)
+{
+    auto ret = hash(&product_id, sizeof(product_id));
+    ret = hash(&number_of_cells, sizeof(number_of_cells), ret);
+    return hash(cells, number_of_cells * sizeof(uint64_t), ret);
+}
+
+void write_at(int file, const void *data, size_t size, size_t offset, const string &path)
+{
+    auto bytes = static_cast<const char *>(data);
+    while (size > 0)
+    {
+        auto written = pwrite(file, bytes, size, offset);
+        if (written < 0)
+        {
+            throw runtime_error("cannot write the raster cache " + path);
+        }
+        bytes += written;
+        size -= written;
+        offset += written;
+    }
+}
+
+// an exclusive lock on the file while in scope, the runs sharing the file take turns to read its index and to append
+class FileLock
+{
+public:
+  FileLock(int file, const string &path) : file(file)
+  {
+      if (flock(file, LOCK_EX) != 0)
+      {
+          throw runtime_error("cannot lock the raster cache " + path);
+      }
+  }
+  FileLock(const FileLock &) = delete;
+  FileLock &operator=(const FileLock &) = delete;
+  ~FileLock() { flock(file, LOCK_UN); }
+
+private:
+  int file;
+};
+} // namespace
+
+RasterCache::RasterCache(const Products &products, double delta, string path, double capacity)
+    : products(products), delta(delta), path(move(path)), capacity(static_cast<size_t>(capacity * (1 << 20)))
+{
+    // the file may be replaced by another run between the open and the lock, then the new one is opened
+    auto lock = unique_ptr<FileLock>();
+    while (true)
+    {
+        file = open(this->path.c_str(), O_RDWR | O_CREAT, 0644);
+        if (file < 0)
+        {
+            throw runtime_error("cannot open the raster cache " + this->path);
+        }
+        lock.reset(new FileLock(file, this->path));
+        struct stat opened, current;
+        if (fstat(file, &opened) == 0 && stat(this->path.c_str(), &current) == 0 && opened.st_ino == current.st_ino &&
+            opened.st_dev == current.st_dev)
+        {
+            break;
+        }
+        lock.reset();
+        close(file);
+    }
+    struct stat status;
+    fstat(file, &status);
+    file_size = status.st_size;
+    map_file();
+
+    // a file of another archive or grid step, not a cache at all, or with a record cut short by an interrupted run,
+    // is started again
+    uint64_t header[2] = {products.size(), fingerprint(products)};
+    if (file_size < header_size || memcmp(mapped, magic, sizeof(magic)) != 0 ||
+        memcmp(mapped + sizeof(magic), &delta, sizeof(delta)) != 0 ||
+        memcmp(mapped + sizeof(magic) + sizeof(delta), header, sizeof(header)) != 0 || !index_records())
+    {
+        lock.reset(); // before the file is closed
+        start_again();
+    }
+}
+
+void RasterCache::start_again()
+{
+    // the new file is written aside then renamed over the old one, the runs still mapping the old one keep reading it,
+    // and the runs opening it find its header complete
+    auto temporary_path = path + "." + to_string(getpid()) + ".tmp";
+    int fresh = open(temporary_path.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if (fresh < 0)
+    {
+        throw runtime_error("cannot open the raster cache " + temporary_path);
+    }
+    uint64_t header[2] = {products.size(), fingerprint(products)};
+    write_at(fresh, magic, sizeof(magic), 0, temporary_path);
+    write_at(fresh, &delta, sizeof(delta), sizeof(magic), temporary_path);
+    write_at(fresh, header, sizeof(header), sizeof(magic) + sizeof(delta), temporary_path);
+    if (rename(temporary_path.c_str(), path.c_str()) != 0)
+    {
+        close(fresh);
+        throw runtime_error("cannot replace the raster cache " + path);
+    }
+    unmap_file();
+    close(file);
+    file = fresh;
+    file_size = header_size;
+    offsets.clear();
+    map_file();
+}
+
+bool RasterCache::index_records()
+{
+    size_t offset = header_size;
+    while (offset < file_size)
+    {
+        if (offset + record_header_size > file_size)
+        {
+            return false;
+        }
+        int32_t product_id;
+        uint32_t number_of_cells;
+        uint64_t record_checksum;
+        memcpy(&product_id, mapped + offset, sizeof(product_id));
+        memcpy(&number_of_cells, mapped + offset + sizeof(product_id), sizeof(number_of_cells));
+        memcpy(&record_checksum, mapped + offset + sizeof(product_id) + sizeof(number_of_cells),
+               sizeof(record_checksum));
+        size_t end = offset + record_header_size + number_of_cells * sizeof(uint64_t);
+        if (product_id < 0 || product_id >= products.size() || end > file_size)
+        {
+            return false;
+        }
+        auto cells = reinterpret_cast<const uint64_t *>(mapped + offset + record_header_size);
+        if (checksum(product_id, number_of_cells, cells) != record_checksum)
+        {
+            return false;
+        }
+        offsets[product_id] = offset;
+        offset = end;
+    }
+    return true;
+}
+
+RasterCache::~RasterCache()
+{
+    unmap_file();
+    close(file);
+}
+
+RasterCache::Cells RasterCache::cells(int product_id, const function<vector<uint64_t>(const Polygon &)> &rasterize)
+{
+    auto entry = entries.find(product_id);
+    if (entry != entries.end())
+    {
+        ++number_of_hits;
+        recent.splice(recent.begin(), recent, entry->second.second);
+        const auto &cells = entry->second.first;
+        return Cells{cells.data(), cells.data() + cells.size()};
+    }
+
+    auto offset = offsets.find(product_id);
+    if (offset != offsets.end() && offset->second < mapped_size)
+    {
+        ++number_of_disk_hits;
+        uint32_t number_of_cells;
+        memcpy(&number_of_cells, mapped + offset->second + sizeof(int32_t), sizeof(number_of_cells));
+        auto first = reinterpret_cast<const uint64_t *>(mapped + offset->second + record_header_size);
+        const auto &cells = remember(product_id, vector<uint64_t>(first, first + number_of_cells));
+        return Cells{cells.data(), cells.data() + cells.size()};
+    }
+
+    ++number_of_misses;
+    auto rasterized = rasterize(products[product_id].polygon);
+    sort(rasterized.begin(), rasterized.end());
+    if (offset == offsets.end()) // else it was appended since the last sync, and evicted already
+    {
+        auto record = vector<uint64_t>(record_header_size / sizeof(uint64_t));
+        int32_t id = product_id;
+        uint32_t number_of_cells = rasterized.size();
+        uint64_t record_checksum = checksum(id, number_of_cells, rasterized.data());
+        memcpy(record.data(), &id, sizeof(id));
+        memcpy(reinterpret_cast<char *>(record.data()) + sizeof(id), &number_of_cells, sizeof(number_of_cells));
+        memcpy(reinterpret_cast<char *>(record.data()) + sizeof(id) + sizeof(number_of_cells), &record_checksum,
+               sizeof(record_checksum));
+        record.insert(record.end(), rasterized.begin(), rasterized.end());
+
+        // other runs may have appended since, the record goes at the end of the file as it is now
+        FileLock lock(file, path);
+        struct stat status;
+        fstat(file, &status);
+        size_t end = status.st_size;
+        write_at(file, record.data(), record.size() * sizeof(uint64_t), end, path);
+        offsets[product_id] = end;
+        file_size = end + record.size() * sizeof(uint64_t);
+    }
+    const auto &cells = remember(product_id, move(rasterized));
+    return Cells{cells.data(), cells.data() + cells.size()};
+}
+
+void RasterCache::sync()
+{
+    if (file_size > mapped_size)
+    {
+        map_file();
+    }
+}
+
+json RasterCache::statistics() const
+{
+    auto report = json();
+    auto number_of_lookups = number_of_hits + number_of_disk_hits + number_of_misses;
+    report["number_of_hits"] = number_of_hits;
+    report["number_of_disk_hits"] = number_of_disk_hits;
+    report["number_of_misses"] = number_of_misses;
+    report["hit_rate"] = number_of_lookups > 0 ? double(number_of_hits + number_of_disk_hits) / number_of_lookups : 0;
+    report["bytes"] = bytes;
+    report["disk_bytes"] = file_size;
+    return report;
+}
+
+void RasterCache::map_file()
+{
+    unmap_file();
+    if (file_size == 0)
+    {
+        return;
+    }
+    auto address = mmap(nullptr, file_size, PROT_READ, MAP_SHARED, file, 0);
+    if (address == MAP_FAILED)
+    {
+        throw runtime_error("cannot map the raster cache " + path);
+    }
+    mapped = static_cast<const char *>(address);
+    mapped_size = file_size;
+}
+
+void RasterCache::unmap_file()
+{
+    if (mapped != nullptr)
+    {
+        munmap(const_cast<char *>(mapped), mapped_size);
+    }
+    mapped = nullptr;
+    mapped_size = 0;
+}
+
+const vector<uint64_t> &RasterCache::remember(int product_id, vector<uint64_t> cells)
+{
+    bytes += cells.size() * sizeof(uint64_t);
+    recent.push_front(product_id);
+    auto &entry = entries[product_id];
+    entry = make_pair(move(cells), recent.begin());
+    // the least recently used are evicted, but never the one just remembered
+    while (bytes > capacity && recent.size() > 1)
+    {
+        auto evicted = entries.find(recent.back());
+        bytes -= evicted->second.first.size() * sizeof(uint64_t);
+        entries.erase(evicted);
+        recent.pop_back();
+    }
+    return entry.first;
+}
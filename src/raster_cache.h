@@ -0,0 +1,70 @@
+#ifndef CGSC_RASTER_CACHE_H
+#define CGSC_RASTER_CACHE_H
+
+#include <cstdint>
+#include <functional>
+#include <list>
+#include <string>
+#include <unordered_map>
+
+#include "model.h"
+
+// The cells of the products of the archive at one grid step, which do not change from a roi to another.
+// Lookups go through an in-process LRU of at most capacity MB, then through a file of the cells rasterized so far,
+// mapped in memory, then rasterize the product and append it to the file, so later runs find it too.
+// The file holds a header (magic, delta, number of products, fingerprint of the archive) then records (product id,
+// number of cells, checksum, sorted cells). Runs sharing the file lock it to index it and to append. A file of another
+// archive or grid step, or with a corrupt record, is replaced by an empty one.
+class RasterCache
+{
+public:
+  struct Cells // sorted keys of the cells of a product, valid until the next lookup
+  {
+      const uint64_t *first, *last;
+      const uint64_t *begin() const { return first; }
+      const uint64_t *end() const { return last; }
+      int size() const { return last - first; }
+  };
+
+  RasterCache(const Products &products, double delta, std::string path, double capacity);
+  RasterCache(const RasterCache &) = delete;
+  RasterCache &operator=(const RasterCache &) = delete;
+  ~RasterCache();
+
+  // the cells of products[product_id], rasterize(polygon) gives them on a miss
+  Cells cells(int product_id, const std::function<std::vector<uint64_t>(const Polygon &)> &rasterize);
+  // maps the records appended since the last sync, the transformer calls it once per roi
+  void sync();
+  nlohmann::json statistics() const;
+
+private:
+  void start_again();
+  bool index_records(); // false when a record is corrupt
+  void map_file();
+  void unmap_file();
+  const std::vector<uint64_t> &remember(int product_id, std::vector<uint64_t> cells);
+
+private:
+  const Products &products;
+  double delta;
+  std::string path;
+  std::size_t capacity; // bytes
+
+  // the LRU, most recently used first
+  std::list<int> recent;
+  std::unordered_map<int, std::pair<std::vector<uint64_t>, std::list<int>::iterator>> entries;
+  std::size_t bytes = 0;
+
+  // the file, records at offsets beyond the mapped size were appended since the last sync
+  int file = -1;
+  const char *mapped = nullptr;
+  std::size_t mapped_size = 0;
+  std::size_t file_size = 0;
+  std::unordered_map<int, std::size_t> offsets; // product id -> offset of its record
+
+  long long number_of_hits = 0;
+  long long number_of_disk_hits = 0;
+  long long number_of_misses = 0;
+};
+
+#endif
@@ -0,0 +1,146 @@
+#include "reduction.h"
+
+#include <algorithm>
+#include <map>
+
+using namespace std;
+using nlohmann::json;
+
+namespace
+{
+// Marks the ranges dominated by another one: it holds all their elements and is cheaper, or as cheap with more
+// elements, or identical with a lower position. This order is strict, so a dominated range is always dominated by
+// a range that is kept.
+vector<bool> dominated_ranges(const Incidence &incidence, const Ranges &ranges, int &number_of_duplicates)
+{
+    auto positions = vector<int>(incidence.number_of_ranges(), -1);
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        positions[ranges[i].id] = i;
+    }
+    auto size = [&](int i) { return incidence.elements_of(ranges[i].id).size(); };
+    auto preferred = [&](int b, int a) { // whether b is preferred to a
+        if (ranges[b].cost != ranges[a].cost)
+        {
+            return ranges[b].cost < ranges[a].cost;
+        }
+        if (size(b) != size(a))
+        {
+            return size(b) > size(a);
+        }
+        return b < a;
+    };
+
+    auto dominated = vector<bool>(ranges.size(), false);
+    number_of_duplicates = 0;
+    for (int a = 0; a < ranges.size(); ++a)
+    {
+        auto elements = incidence.elements_of(ranges[a].id);
+        if (elements.size() == 0) // covers nothing
+        {
+            dominated[a] = true;
+            continue;
+        }
+        // a dominating range holds every element, so only the holders of the rarest one are candidates
+        auto rarest = *min_element(elements.begin(), elements.end(), [&incidence](int x, int y) {
+            return incidence.ranges_of(x).size() < incidence.ranges_of(y).size();
+        });
+        for (auto range_id : incidence.ranges_of(rarest))
+        {
+            int b = positions[range_id];
+            if (b < 0 || b == a || !preferred(b, a))
+            {
+                continue;
+            }
+            auto others = incidence.elements_of(range_id);
+            if (includes(others.begin(), others.end(), elements.begin(), elements.end()))
+            {
+                dominated[a] = true;
+                number_of_duplicates += others.size() == elements.size() ? 1 : 0;
+                break;
+            }
+        }
+    }
+    return dominated;
+}
+} // namespace
+
+json reduce(Universe &universe, Ranges &ranges)
+{
+    auto report = json();
+    const auto &incidence = universe.incidence;
+    if (incidence.number_of_elements() == 0) // nothing to reduce, the online transformer builds no incidence
+    {
+        return report;
+    }
+    int number_of_ranges = ranges.size();
+    int number_of_elements = incidence.number_of_elements();
+
+    int number_of_duplicates = 0;
+    auto dominated = dominated_ranges(incidence, ranges, number_of_duplicates);
+    auto kept = Ranges();
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        if (!dominated[i])
+        {
+            kept.push_back(ranges[i]);
+        }
+    }
+
+    // the elements are grouped by the kept ranges holding them, in the new positions
+    auto positions = vector<int>(incidence.number_of_ranges(), -1);
+    for (int i = 0; i < kept.size(); ++i)
+    {
+        positions[kept[i].id] = i;
+    }
+    auto builder = IncidenceBuilder();
+    auto groups = map<vector<int>, int>();
+    auto group_values = vector<double>();
+    auto group_of = vector<int>(number_of_elements);
+    auto holders = vector<int>();
+    for (int element = 0; element < number_of_elements; ++element)
+    {
+        holders.clear();
+        for (auto range_id : incidence.ranges_of(element))
+        {
+            if (positions[range_id] >= 0)
+            {
+                holders.push_back(positions[range_id]);
+            }
+        }
+        auto group = groups.emplace(holders, group_values.size());
+        if (group.second)
+        {
+            group_values.push_back(0);
+        }
+        group_of[element] = group.first->second;
+        group_values[group_of[element]] += incidence.values[element];
+    }
+    for (auto value : group_values)
+    {
+        builder.add_element(value);
+    }
+    for (int i = 0; i < kept.size(); ++i)
+    {
+        for (auto element : incidence.elements_of(kept[i].id))
+        {
+            builder.add(i, group_of[element]);
+        }
+    }
+
+    // the value of the universe is unchanged, it is not summed again in another order
+    universe.incidence = builder.build(kept.size());
+    ranges = move(kept);
+    for (int i = 0; i < ranges.size(); ++i)
+    {
+        ranges[i].id = i;
+        ranges[i].update_value(universe.incidence);
+    }
+
+    report["number_of_duplicate_ranges"] = number_of_duplicates;
+    report["number_of_dominated_ranges"] = number_of_ranges - static_cast<int>(ranges.size()) - number_of_duplicates;
+    report["number_of_merged_elements"] = number_of_elements - universe.incidence.number_of_elements();
+    report["number_of_ranges"] = ranges.size();
+    report["number_of_elements"] = universe.incidence.number_of_elements();
+    return report;
+}
@@ -0,0 +1,13 @@
+#ifndef CGSC_REDUCTION_H
+#define CGSC_REDUCTION_H
+
+#include "model.h"
+
+// Shrinks the instance without changing its optimal cost, before it is optimized:
+// - a range whose elements are all held by a range of lower or equal cost is removed, of identical ranges only the
+//   cheapest is kept
+// - the elements held by exactly the same ranges are merged into one element of their total value
+// Ranges are renumbered, their ids stay their positions. Returns the statistics of the reduction.
+nlohmann::json reduce(Universe &universe, Ranges &ranges);
+
+#endif
@@ -0,0 +1,181 @@
+#ifndef CGSC_SMALL_VECTOR_HPP
+#define CGSC_SMALL_VECTOR_HPP
+
+#include <algorithm>
+#include <cstddef>
+#include <initializer_list>
+#include <iterator>
+#include <type_traits>
+
+// Contiguous sequence storing up to N elements inline, it only goes to the heap when it grows beyond N.
+// Only trivially copyable element types are supported, elements are moved around with std::copy.
+template <typename T, std::size_t N>
+class small_vector
+{
+  static_assert(std::is_trivially_copyable<T>::value, "small_vector only holds trivially copyable types");
+
+public:
+  using value_type = T;
+  using size_type = std::size_t;
+  using reference = T &;
+  using const_reference = const T &;
+  using iterator = T *;
+  using const_iterator = const T *;
+
+  small_vector() : data_(inline_data_), size_(0), capacity_(N) {}
+
+  small_vector(std::initializer_list<T> values) : small_vector()
+  {
+    assign(values.begin(), values.end());
+  }
+
+  template <typename InputIt, typename = typename std::iterator_traits<InputIt>::iterator_category>
+  small_vector(InputIt first, InputIt last) : small_vector()
+  {
+    assign(first, last);
+  }
+
+  small_vector(const small_vector &other) : small_vector()
+  {
+    assign(other.begin(), other.end());
+  }
+
+  small_vector(small_vector &&other) noexcept : small_vector()
+  {
+    steal(other);
+  }
+
+  small_vector &operator=(const small_vector &other)
+  {
+    if (this != &other)
+    {
+      assign(other.begin(), other.end());
+    }
+    return *this;
+  }
+
+  small_vector &operator=(small_vector &&other) noexcept
+  {
+    if (this != &other)
+    {
+      release();
+      steal(other);
+    }
+    return *this;
+  }
+
+  ~small_vector()
+  {
+    release();
+  }
+
+  template <typename InputIt>
+  void assign(InputIt first, InputIt last)
+  {
+    clear();
+    for (; first != last; ++first)
+    {
+      push_back(*first);
+    }
+  }
+
+  void reserve(size_type capacity)
+  {
+    if (capacity <= capacity_)
+    {
+      return;
+    }
+    T *data = new T[capacity];
+    std::copy(data_, data_ + size_, data);
+    release();
+    data_ = data;
+    capacity_ = capacity;
+  }
+
+  void push_back(const T &value)
+  {
+    if (size_ == capacity_)
+    {
+      T copy = value; // value may live in this container
+      reserve(2 * capacity_);
+      data_[size_++] = copy;
+      return;
+    }
+    data_[size_++] = value;
+  }
+
+  template <typename... Args>
+  void emplace_back(Args &&... args)
+  {
+    push_back(T(std::forward<Args>(args)...));
+  }
+
+  void pop_back() { --size_; }
+  void clear() { size_ = 0; }
+
+  size_type size() const { return size_; }
+  bool empty() const { return size_ == 0; }
+
+  T *data() { return data_; }
+  const T *data() const { return data_; }
+  iterator begin() { return data_; }
+  iterator end() { return data_ + size_; }
+  const_iterator begin() const { return data_; }
+  const_iterator end() const { return data_ + size_; }
+
+  T &operator[](size_type i) { return data_[i]; }
+  const T &operator[](size_type i) const { return data_[i]; }
+  T &front() { return data_[0]; }
+  const T &front() const { return data_[0]; }
+  T &back() { return data_[size_ - 1]; }
+  const T &back() const { return data_[size_ - 1]; }
+
+  friend bool operator==(const small_vector &a, const small_vector &b)
+  {
+    return a.size() == b.size() && std::equal(a.begin(), a.end(), b.begin());
+  }
+
+  friend bool operator!=(const small_vector &a, const small_vector &b)
+  {
+    return !(a == b);
+  }
+
+private:
+  bool on_heap() const { return data_ != inline_data_; }
+
+  void release()
+  {
+    if (on_heap())
+    {
+      delete[] data_;
+    }
+    data_ = inline_data_;
+    capacity_ = N;
+  }
+
+  void steal(small_vector &other)
+  {
+    if (other.on_heap()) // take over the heap buffer
+    {
+      data_ = other.data_;
+      capacity_ = other.capacity_;
+      size_ = other.size_;
+      other.data_ = other.inline_data_;
+      other.capacity_ = N;
+    }
+    else
+    {
+      std::copy(other.begin(), other.end(), inline_data_);
+      size_ = other.size_;
+    }
+    other.size_ = 0;
+  }
+
+private:
+  T *data_;
+  size_type size_;
+  size_type capacity_;
+  T inline_data_[N];
+};
+
+#endif
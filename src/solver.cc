@@ -1,21 +1,45 @@
 #include "solver.h"
 
+#include "decomposition.h"
 #include "global.h"
+#include "reduction.h"
 
 using namespace std;
 using nlohmann::json;
 
-Solver::Solver(shared_ptr<Transformer> transformer, shared_ptr<Optimizer> optimizer)
-    : transformer(transformer), optimizer(optimizer)
+Solver::Solver(shared_ptr<Transformer> transformer,
+               shared_ptr<Optimizer> optimizer,
+               shared_ptr<const GridIndex> product_index,
+               bool reduction,
+               int coverage_levels,
+               int threads)
+    : transformer(transformer), optimizer(optimizer), product_index(product_index), reduction(reduction),
+      coverage_levels(coverage_levels), threads(threads)
 {
 }
 
-Products Solver::pre_process(const Roi &roi, const Products &products) const
+Products Solver::pre_process(const Roi &roi, const Products &products, json &report) const
 {
+    // only the products whose bounding boxes overlap the roi's can intersect it
+    auto candidates = vector<int>();
+    if (product_index != nullptr)
+    {
+        candidates = product_index->query(bounding_box(roi.polygon));
+    }
+    else
+    {
+        for (int i = 0; i < products.size(); ++i)
+        {
+            candidates.push_back(i);
+        }
+    }
+    report["number_of_pruned_products"] = products.size() - candidates.size();
+
     // select possible products and crop them
     auto possible_products = Products();
-    for (const auto &product : products)
+    for (auto candidate : candidates)
     {
+        const auto &product = products[candidate];
         auto inner_polygons = intersection(roi.polygon, product.polygon);
         if (inner_polygons.size() > 0)
         {
@@ -37,7 +61,7 @@ json Solver::solve(const Roi &roi, const Products &products, Products &&result_p
     }
     report["transformer"] = transformer->tag();
     report["area_of_roi"] = area(roi.polygon);
-    auto possible_products = pre_process(roi, products);
+    auto possible_products = pre_process(roi, products, report);
     report["number_of_possible_products"] = possible_products.size();
     auto sw = Stopwatch();
     auto universe = Universe();
@@ -45,7 +69,7 @@ json Solver::solve(const Roi &roi, const Products &products, Products &&result_p
     auto result_ranges = Ranges();
     report["transformation"] = transformer->transform(roi, possible_products, universe, ranges);
     report["transformation"]["time"] = sw.lap();
-    report["number_of_cells"] = universe.elements.size();
+    report["number_of_cells"] = universe.incidence.number_of_elements();
 
     if (optimizer == nullptr)
     {
@@ -53,9 +77,32 @@ json Solver::solve(const Roi &roi, const Products &products, Products &&result_p
         return report;
     }
 
+    if (reduction)
+    {
+        sw.restart();
+        report["reduction"] = reduce(universe, ranges);
+        report["reduction"]["time"] = sw.lap();
+    }
+
     report["optimizer"] = optimizer->tag();
     sw.restart();
-    report["optimization"] = optimizer->optimize(universe, ranges, result_ranges);
+    auto decomposition = json();
+    if (coverage_levels > 0)
+    {
+        decomposition = solve_by_components(universe, ranges, *optimizer, coverage_levels, threads, result_ranges);
+    }
+    if (!decomposition.is_null() && decomposition["decomposed"]) // the optimizer ran on the components
+    {
+        report["optimization"] = decomposition;
+    }
+    else
+    {
+        report["optimization"] = optimizer->optimize(universe, ranges, result_ranges);
+        if (!decomposition.is_null())
+        {
+            report["optimization"]["decomposition"] = decomposition;
+        }
+    }
     report["optimization"]["time"] = sw.lap();
     if (result_ranges.size() > 0)
     {
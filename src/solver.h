@@ -7,20 +7,30 @@
 
 #include "transformer.h"
 #include "optimizer.h"
+#include "spatial_index.h"
 
 class Solver
 {
 public:
-  Solver(std::shared_ptr<Transformer> transformer, std::shared_ptr<Optimizer> optimizer);
+  Solver(std::shared_ptr<Transformer> transformer,
+         std::shared_ptr<Optimizer> optimizer,
+         std::shared_ptr<const GridIndex> product_index = nullptr, // product_index is built over the products passed to solve()
+         bool reduction = true,                                     // whether the instance is reduced before it is optimized
+         int coverage_levels = 0,                                   // see solve_by_components, 0 never decomposes
+         int threads = 1);                                          // workers of solve_by_components
   nlohmann::json solve(const Roi &roi, const Products &products, Products &&result_products) const;
   std::string tag() const;
 
 private:
-  Products pre_process(const Roi &roi, const Products &products) const;
+  Products pre_process(const Roi &roi, const Products &products, nlohmann::json &report) const;
 
 private:
   std::shared_ptr<Transformer> transformer;
   std::shared_ptr<Optimizer> optimizer;
+  std::shared_ptr<const GridIndex> product_index;
+  bool reduction;
+  int coverage_levels;
+  int threads;
 };
 
 #endif
\ No newline at end of file
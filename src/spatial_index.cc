@@ -0,0 +1,137 @@
+#include "spatial_index.h"
+
+#include <algorithm>
+#include <cmath>
+
+using namespace std;
+
+GridIndex::GridIndex(const BoundingBox &extent, double cell_size)
+{
+    initialize(extent, cell_size);
+}
+
+GridIndex::GridIndex(const vector<BoundingBox> &boxes, double cell_size)
+{
+    if (boxes.size() == 0)
+    {
+        initialize(BoundingBox{0, 0, 1, 1}, 1);
+        return;
+    }
+
+    auto extent = boxes.front();
+    double total_area = 0;
+    for (const auto &box : boxes)
+    {
+        extent.minx = std::min(extent.minx, box.minx);
+        extent.miny = std::min(extent.miny, box.miny);
+        extent.maxx = std::max(extent.maxx, box.maxx);
+        extent.maxy = std::max(extent.maxy, box.maxy);
+        total_area += (box.maxx - box.minx) * (box.maxy - box.miny);
+    }
+
+    // a bucket about the size of an average box keeps both the number of buckets per box and
+    // the number of boxes per bucket small
+    initialize(extent, cell_size > 0 ? cell_size : sqrt(total_area / boxes.size()));
+
+    for (int i = 0; i < boxes.size(); ++i)
+    {
+        insert(i, boxes[i]);
+    }
+}
+
+void GridIndex::initialize(const BoundingBox &extent, double cell_size)
+{
+    const int max_columns = 4096; // bound the memory of the grid for tiny or degenerate cell sizes
+    double width = extent.maxx - extent.minx;
+    double height = extent.maxy - extent.miny;
+    if (!(cell_size > 0)) // also nan, e.g. the mean size of no boxes
+    {
+        cell_size = std::max(width, height);
+    }
+    cell_size = std::max(cell_size, std::max(width, height) / max_columns);
+    if (cell_size <= 0)
+    {
+        cell_size = 1;
+    }
+    this->extent = extent;
+    this->cell_size = cell_size;
+    columns = std::max(1, static_cast<int>(ceil(width / cell_size)));
+    rows = std::max(1, static_cast<int>(ceil(height / cell_size)));
+    buckets.assign(columns * rows, vector<int>());
+}
+
+int GridIndex::column(double x) const
+{
+    int i = floor((x - extent.minx) / cell_size);
+    return std::min(std::max(i, 0), columns - 1); // boxes outside the extent are clamped to the border
+}
+
+int GridIndex::row(double y) const
+{
+    int j = floor((y - extent.miny) / cell_size);
+    return std::min(std::max(j, 0), rows - 1);
+}
+
+void GridIndex::insert(int id, const BoundingBox &box)
+{
+    if (id >= boxes.size())
+    {
+        boxes.resize(id + 1);
+    }
+    boxes[id] = box;
+    ++number_of_items;
+    for (int j = row(box.miny); j <= row(box.maxy); ++j)
+    {
+        for (int i = column(box.minx); i <= column(box.maxx); ++i)
+        {
+            buckets[j * columns + i].push_back(id);
+        }
+    }
+}
+
+void GridIndex::remove(int id)
+{
+    // an id that is not in the index, never inserted or removed already, is ignored
+    if (id < 0 || id >= boxes.size())
+    {
+        return;
+    }
+    const auto &box = boxes[id];
+    bool found = false;
+    for (int j = row(box.miny); j <= row(box.maxy); ++j)
+    {
+        for (int i = column(box.minx); i <= column(box.maxx); ++i)
+        {
+            auto &bucket = buckets[j * columns + i];
+            auto position = find(bucket.begin(), bucket.end(), id);
+            if (position != bucket.end())
+            {
+                bucket.erase(position);
+                found = true;
+            }
+        }
+    }
+    number_of_items -= found ? 1 : 0;
+}
+
+vector<int> GridIndex::query(const BoundingBox &box) const
+{
+    auto ret = vector<int>();
+    for (int j = row(box.miny); j <= row(box.maxy); ++j)
+    {
+        for (int i = column(box.minx); i <= column(box.maxx); ++i)
+        {
+            for (auto id : buckets[j * columns + i])
+            {
+                if (overlaps(boxes[id], box))
+                {
+                    ret.push_back(id);
+                }
+            }
+        }
+    }
+    // an item spanning several buckets is reported once per bucket
+    sort(ret.begin(), ret.end());
+    ret.erase(unique(ret.begin(), ret.end()), ret.end());
+    return ret;
+}
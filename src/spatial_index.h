@@ -0,0 +1,35 @@
+#ifndef CGSC_SPATIAL_INDEX_H
+#define CGSC_SPATIAL_INDEX_H
+
+#include <vector>
+
+#include "geometry.h"
+
+// Uniform grid of buckets over bounding boxes. An item is registered in every bucket its box touches,
+// so a query only has to look at the buckets under the query box instead of all items.
+class GridIndex
+{
+public:
+  GridIndex(const BoundingBox &extent, double cell_size); // empty index, filled by insert()
+  // static index, the id of boxes[i] is i, cell_size defaults to the square root of the mean box area
+  GridIndex(const std::vector<BoundingBox> &boxes, double cell_size = 0);
+  void insert(int id, const BoundingBox &box);
+  void remove(int id); // does nothing for an id that is not in the index
+  std::vector<int> query(const BoundingBox &box) const; // ids whose boxes overlap box, in ascending order
+  int size() const { return number_of_items; }
+
+private:
+  void initialize(const BoundingBox &extent, double cell_size);
+  int column(double x) const;
+  int row(double y) const;
+
+private:
+  BoundingBox extent;
+  double cell_size;
+  int columns, rows;
+  int number_of_items = 0;
+  std::vector<std::vector<int>> buckets;
+  std::vector<BoundingBox> boxes; // indexed by id
+};
+
+#endif
@@ -1,11 +1,129 @@
 #include "transformer.h"
+#include "spatial_index.h"
 
 #include <unordered_map>
 #include <set>
+#include <algorithm>
+#include <cstdint>
+#include <numeric>
+#include <stdexcept>
 
 using namespace std;
 using nlohmann::json;
 
+namespace
+{
+// Hash-consed owner sets. Each distinct set of ranges is stored once as a sorted vector of range ids
+// (positions in Ranges) and cells refer to it by a 32-bit signature. The empty set has signature 0.
+class OwnerSets
+{
+  public:
+    OwnerSets()
+    {
+        intern({});
+    }
+
+    // signature of the set ∪ {range_id}, cached since a cell is clipped by the same few ranges again and again
+    uint32_t with(uint32_t signature, int range_id)
+    {
+        auto key = (static_cast<uint64_t>(signature) << 32) | static_cast<uint32_t>(range_id);
+        auto it = transitions.find(key);
+        if (it != transitions.end())
+        {
+            return it->second;
+        }
+        auto owners = sets[signature];
+        auto position = lower_bound(owners.begin(), owners.end(), range_id);
+        if (position == owners.end() || *position != range_id)
+        {
+            owners.insert(position, range_id);
+        }
+        return transitions[key] = intern(move(owners));
+    }
+
+    const vector<int> &operator[](uint32_t signature) const
+    {
+        return sets[signature];
+    }
+
+    int size() const
+    {
+        return sets.size();
+    }
+
+  private:
+    uint32_t intern(vector<int> owners)
+    {
+        auto it = signatures.find(owners);
+        if (it != signatures.end())
+        {
+            return it->second;
+        }
+        uint32_t signature = sets.size();
+        sets.push_back(owners);
+        signatures[move(owners)] = signature;
+        return signature;
+    }
+
+    struct Hash
+    {
+        size_t operator()(const vector<int> &owners) const
+        {
+            size_t ret = owners.size();
+            for (auto id : owners)
+            {
+                ret ^= hash<int>()(id) + 0x9e3779b9 + (ret << 6) + (ret >> 2);
+            }
+            return ret;
+        }
+    };
+
+    vector<vector<int>> sets;
+    unordered_map<vector<int>, uint32_t, Hash> signatures;
+    unordered_map<uint64_t, uint32_t> transitions;
+};
+
+// one element per owner set of signatures, in that order, valued by values[signature]
+void add_owner_set_elements(const OwnerSets &owner_sets,
+                            const vector<double> &values,
+                            const vector<uint32_t> &signatures,
+                            IncidenceBuilder &builder)
+{
+    for (auto signature : signatures)
+    {
+        // update universe
+        int cell_index = builder.add_element(values[signature]);
+
+        // update ranges
+        for (auto range_id : owner_sets[signature])
+        {
+            builder.add(range_id, cell_index);
+        }
+    }
+}
+
+// one element per used owner set, valued by values[signature]. The ids follow the lexicographic order of the
+// owner sets, the same order a map<set<Range *>, double> would give.
+void add_owner_set_elements(const OwnerSets &owner_sets,
+                            const vector<double> &values,
+                            const vector<bool> &used,
+                            IncidenceBuilder &builder)
+{
+    auto signatures = vector<uint32_t>();
+    for (uint32_t signature = 0; signature < used.size(); ++signature)
+    {
+        if (used[signature])
+        {
+            signatures.push_back(signature);
+        }
+    }
+    sort(signatures.begin(), signatures.end(), [&owner_sets](uint32_t a, uint32_t b) {
+        return owner_sets[a] < owner_sets[b];
+    });
+    add_owner_set_elements(owner_sets, values, signatures, builder);
+}
+} // namespace
+
 Transformer::~Transformer() {}
 
 json Transformer::transform(const Roi &roi,
@@ -23,125 +141,579 @@ json Transformer::transform(const Roi &roi,
         range.update_cost();
         return range;
     });
+    for (int i = 0; i < ranges.size(); ++i)
+        ranges[i].id = i;
 
-    transform_impl(roi, products, universe, ranges);
+    auto builder = IncidenceBuilder();
+    transform_impl(roi, products, builder, ranges);
+    universe.incidence = builder.build(ranges.size());
 
     universe.update_value();
     for (auto &range : ranges)
-        range.update_value();
+        range.update_value(universe.incidence);
 
     return report;
 }
 
-void Transformer::add_imagery_cell(Universe &universe) const
+void Transformer::add_imagery_cell(const Roi &roi, IncidenceBuilder &builder) const
 {
     // add imagery cell
-    double uncovered_area = area(universe.roi->polygon) - func::sum(universe.elements,
-                                                                    [](const Element &e) {
-                                                                        return e.value;
-                                                                    });
+    double uncovered_area = area(roi.polygon) - builder.total_value();
 
-    report["uncovered_percentage"] = uncovered_area / area(universe.roi->polygon);
-    universe.elements.insert(Element{static_cast<int>(universe.elements.size()), uncovered_area});
+    report["uncovered_percentage"] = uncovered_area / area(roi.polygon);
+    builder.add_element(uncovered_area);
 }
 
 void OnlineTranformer::transform_impl(const Roi &roi,
                                       const Products &products,
-                                      Universe &universe,
-                                      Ranges &ranges) const
+                                      IncidenceBuilder &builder,
+                                      const Ranges &ranges) const
 
 {
 }
 
-DiscreteTransformer::DiscreteTransformer(double delta) : delta(delta)
+DiscreteTransformer::DiscreteTransformer(double delta, shared_ptr<RasterCache> cache) : delta(delta), cache(cache)
 {
 
 }
 
-unordered_set<int> DiscreteTransformer::discretize(const Polygon &polygon,
-                                                   function<bool(const Polygon &)> condition) const
+unordered_set<uint64_t> DiscreteTransformer::discretize(const Polygon &polygon) const
 {
-    double minx, miny, maxx, maxy;
-    minx = maxx = polygon.begin()->x;
-    miny = maxy = polygon.begin()->y;
-    for (const auto &p : polygon)
-    {
-        minx = std::min(minx, p.x);
-        miny = std::min(miny, p.y);
-        maxx = std::max(maxx, p.x);
-        maxy = std::max(maxy, p.y);
-    }
-    minx = floor(minx / delta) * delta;
-    miny = floor(miny / delta) * delta;
-    maxx = ceil(maxx / delta) * delta;
-    maxy = ceil(maxy / delta) * delta;
-    auto ret = unordered_set<int>();
+    auto bb = bounding_box(polygon);
+    double minx = floor(bb.minx / delta) * delta;
+    double miny = floor(bb.miny / delta) * delta;
+    double maxx = ceil(bb.maxx / delta) * delta;
+    double maxy = ceil(bb.maxy / delta) * delta;
+
+    // the corners of the cells, stepped the way the cells are, so they keep their exact coordinates
+    auto xs = vector<double>();
+    auto ys = vector<double>();
     for (double x = minx; x < maxx; x += delta)
     {
-        for (double y = miny; y < maxy; y += delta)
+        xs.push_back(x);
+    }
+    xs.push_back(xs.empty() ? minx : xs.back() + delta);
+    for (double y = miny; y < maxy; y += delta)
+    {
+        ys.push_back(y);
+    }
+    ys.push_back(ys.empty() ? miny : ys.back() + delta);
+
+    // the corners of a row that are not outside the polygon make a span, since it is convex. The span is guessed from
+    // where the row crosses the edges, then its ends are moved until they agree with outside()
+    int last = xs.size() - 1;
+    auto spans = vector<pair<int, int>>(); // [first, last] corners of each row, first > last when empty
+    for (auto y : ys)
+    {
+        double left_x = numeric_limits<double>::max(), right_x = numeric_limits<double>::lowest();
+        double nearest_y = numeric_limits<double>::max(); // the distance to the vertices closest to the row
+        auto s = polygon.back();
+        for (const auto &e : polygon)
+        {
+            if (min(s.y, e.y) <= y && y <= max(s.y, e.y))
+            {
+                double x = s.y == e.y ? s.x : s.x + (y - s.y) / (e.y - s.y) * (e.x - s.x);
+                double other_x = s.y == e.y ? e.x : x;
+                left_x = min({left_x, x, other_x});
+                right_x = max({right_x, x, other_x});
+            }
+            nearest_y = min(nearest_y, abs(e.y - y));
+            s = e;
+        }
+        // a row about level with a side, or missing the polygon by less than the tolerance of outside(), may have its
+        // corners in all along that side, so the guess spans the vertices that close to the row (to its nearest
+        // vertices when it misses)
+        double level = (left_x > right_x ? nearest_y : 0) + 1e-5;
+        for (const auto &e : polygon)
+        {
+            if (abs(e.y - y) <= level)
+            {
+                left_x = min(left_x, e.x);
+                right_x = max(right_x, e.x);
+            }
+        }
+        auto corner_is_in = [&](int k) { return !outside({xs[k], y}, polygon); };
+        int first = max(0, static_cast<int>(ceil((left_x - minx) / delta)));
+        int second = min(last, static_cast<int>(floor((right_x - minx) / delta)));
+        if (first > second)
+        {
+            first = second = max(0, min(last, static_cast<int>(round((left_x - minx) / delta))));
+        }
+        while (first <= second && !corner_is_in(first))
+        {
+            ++first;
+        }
+        while (second >= first && !corner_is_in(second))
+        {
+            --second;
+        }
+        if (first <= second)
         {
-            auto grid_cell = box({x, y}, {x + delta, y + delta});
-            if (condition(grid_cell))
+            while (first > 0 && corner_is_in(first - 1))
+            {
+                --first;
+            }
+            while (second < last && corner_is_in(second + 1))
             {
-                ret.insert(unique_index(grid_cell));
+                ++second;
             }
         }
+        spans.emplace_back(first, second);
+    }
+
+    // a cell is in when its four corners are, i.e. its columns are in the spans of both its rows
+    auto ret = unordered_set<uint64_t>();
+    for (int row = 0; row + 1 < ys.size(); ++row)
+    {
+        int first = max(spans[row].first, spans[row + 1].first);
+        int second = min(spans[row].second, spans[row + 1].second);
+        for (int column = first; column < second; ++column)
+        {
+            ret.insert(unique_index({xs[column], ys[row]}));
+        }
     }
     return ret;
 }
 
-int DiscreteTransformer::unique_index(const Polygon &grid_cell) const
+// spreads the 32 bits of x over the even bits of the result
+static uint64_t spread_bits(uint64_t x)
+{
+    x = (x | x << 16) & 0x0000FFFF0000FFFF;
+    x = (x | x << 8) & 0x00FF00FF00FF00FF;
+    x = (x | x << 4) & 0x0F0F0F0F0F0F0F0F;
+    x = (x | x << 2) & 0x3333333333333333;
+    x = (x | x << 1) & 0x5555555555555555;
+    return x;
+}
+
+uint64_t DiscreteTransformer::unique_index(const Point &lower_left) const
 {
-    auto lower_left = grid_cell.front();
-    uint i = lower_left.x / delta;
-    uint j = lower_left.y / delta;
-    assert(j < (1 << 16) && i < (1 << 16) && "index overflow");
-    return i + (j << 16);
+    // the corners are multiples of delta up to the rounding of their steps, so a cell gets the same key whatever
+    // polygon it is found in. Columns and rows are biased by 2^31 so negative coordinates keep their order
+    auto column = static_cast<uint32_t>(llround(lower_left.x / delta) + (int64_t(1) << 31));
+    auto row = static_cast<uint32_t>(llround(lower_left.y / delta) + (int64_t(1) << 31));
+    return spread_bits(column) | spread_bits(row) << 1;
 }
 
 void DiscreteTransformer::transform_impl(const Roi &roi,
                                          const Products &products,
-                                         Universe &universe,
-                                         Ranges &ranges) const
+                                         IncidenceBuilder &builder,
+                                         const Ranges &ranges) const
 {
     auto element_value = delta * delta;
-    auto id_map = unordered_map<int, int>();
-    for (auto &range : ranges)
+    auto cells_of_ranges = vector<vector<uint64_t>>();
+    auto keys = vector<uint64_t>();
+    auto roi_cells = cache != nullptr ? discretize(roi.polygon) : unordered_set<uint64_t>();
+    auto rasterize = [this](const Polygon &polygon) {
+        auto cells = discretize(polygon);
+        return vector<uint64_t>(cells.begin(), cells.end());
+    };
+    for (const auto &range : ranges)
     {
-        auto indexes = discretize(range.product->polygon, [&range](const Polygon &grid_cell) {
-            return all_of(grid_cell.begin(), grid_cell.end(), [&range](const Point &p) { return !outside(p, range.product->polygon); });
-        });
-        for (auto index : indexes)
+        if (cache != nullptr && range.product->id >= 0) // the cells of the whole product inside the roi
         {
-            if (id_map.count(index) == 0)
+            cells_of_ranges.emplace_back();
+            for (auto cell : cache->cells(range.product->id, rasterize))
             {
-                int new_id = id_map.size();
-                id_map[index] = new_id;
+                if (roi_cells.count(cell))
+                {
+                    cells_of_ranges.back().push_back(cell);
+                }
             }
-            auto id = id_map[index];
-            range.elements.insert(Element{id, element_value});
-            universe.elements.insert(Element{id, element_value});
         }
+        else
+        {
+            auto cells = discretize(range.product->polygon); // the cells inside the product
+            cells_of_ranges.emplace_back(cells.begin(), cells.end());
+        }
+        keys.insert(keys.end(), cells_of_ranges.back().begin(), cells_of_ranges.back().end());
+    }
+    if (cache != nullptr)
+    {
+        cache->sync();
+        report["raster_cache"] = cache->statistics();
+    }
+
+    // the cells held by the same ranges are one element, the cells are looked up by binary search over their keys
+    sort(keys.begin(), keys.end());
+    keys.erase(unique(keys.begin(), keys.end()), keys.end());
+    auto owner_sets = OwnerSets();
+    auto cell_owners = vector<uint32_t>(keys.size(), 0);
+    for (const auto &range : ranges)
+    {
+        for (auto key : cells_of_ranges[range.id])
+        {
+            auto &owners = cell_owners[lower_bound(keys.begin(), keys.end(), key) - keys.begin()];
+            owners = owner_sets.with(owners, range.id);
+        }
+    }
+    // the elements are numbered in Z-order of their first cells, so the elements of a range, and of nearby ranges,
+    // stay close in memory
+    auto values = vector<double>(owner_sets.size(), 0);
+    auto signatures = vector<uint32_t>();
+    for (auto owners : cell_owners)
+    {
+        if (values[owners] == 0)
+        {
+            signatures.push_back(owners);
+        }
+        values[owners] += element_value;
     }
-    add_imagery_cell(universe);
+    report["number_of_grid_cells"] = keys.size();
+    report["number_of_owner_sets"] = owner_sets.size();
+    add_owner_set_elements(owner_sets, values, signatures, builder);
+    add_imagery_cell(roi, builder);
+}
+
+// Visits the leaves of a quadtree over the roi, whose cells are numbered by their lower left corners on the grid of
+// step min_size, a cell of level l being 2^l by 2^l grid cells. A cell is split only while it straddles the boundary
+// of a range, down to min_size. leaf(cell, size, owners, straddled) gets the leaves in or straddling a range, with
+// the signature of the ranges holding them and the ranges they still straddle at min_size.
+// A cell is in a range when its four corners are not outside it or, when strict, inside it, and out of it when the
+// range is on the outer side of the cell's sides or of one of its edges. The children of a cell in or out of a range
+// are too, so only the ranges it straddles are checked again.
+template <class Leaf>
+void visit_quadtree(const Roi &roi, const Ranges &ranges, double min_size, bool strict, OwnerSets &owner_sets, Leaf leaf)
+{
+    auto range_boxes = func::map(ranges, [](const Range &range) {
+        return bounding_box(range.product->polygon);
+    });
+    enum class Side
+    {
+        in,
+        out,
+        across
+    };
+    auto side_of = [&](int range_id, const Polygon &cell, const BoundingBox &cell_box) {
+        const auto &polygon = ranges[range_id].product->polygon;
+        if (!overlaps(range_boxes[range_id], cell_box))
+        {
+            return Side::out;
+        }
+        if (all_of(cell.begin(), cell.end(), [&polygon, strict](const Point &corner) {
+                return strict ? inside(corner, polygon) : !outside(corner, polygon);
+            }))
+        {
+            return Side::in;
+        }
+        auto s = polygon.back();
+        for (const auto &e : polygon)
+        {
+            if (all_of(cell.begin(), cell.end(), [&](const Point &corner) { return right(corner, {s, e}); }))
+            {
+                return Side::out;
+            }
+            s = e;
+        }
+        return Side::across;
+    };
+
+    function<void(int64_t, int64_t, int, uint32_t, const vector<int> &)> subdivide;
+    subdivide = [&](int64_t column, int64_t row, int level, uint32_t owners, const vector<int> &candidates) {
+        double size = ldexp(min_size, level);
+        auto lower_left = Point{column * min_size, row * min_size};
+        auto cell = box(lower_left, {lower_left.x + size, lower_left.y + size});
+        auto cell_box = BoundingBox{lower_left.x, lower_left.y, lower_left.x + size, lower_left.y + size};
+        auto straddled = vector<int>();
+        for (auto range_id : candidates)
+        {
+            auto side = side_of(range_id, cell, cell_box);
+            if (side == Side::in)
+            {
+                owners = owner_sets.with(owners, range_id);
+            }
+            else if (side == Side::across)
+            {
+                straddled.push_back(range_id);
+            }
+        }
+        if (straddled.empty() || level == 0)
+        {
+            if (owners != 0 || !straddled.empty())
+            {
+                leaf(cell, size, owners, straddled);
+            }
+            return;
+        }
+        int64_t half = int64_t(1) << (level - 1);
+        for (auto offset : {make_pair(0, 0), make_pair(1, 0), make_pair(0, 1), make_pair(1, 1)})
+        {
+            subdivide(column + offset.first * half, row + offset.second * half, level - 1, owners, straddled);
+        }
+    };
+
+    // the root is the smallest cell of a power of two grid cells holding the roi
+    auto bb = bounding_box(roi.polygon);
+    auto column = static_cast<int64_t>(floor(bb.minx / min_size));
+    auto row = static_cast<int64_t>(floor(bb.miny / min_size));
+    auto extent = max(static_cast<int64_t>(ceil(bb.maxx / min_size)) - column,
+                      static_cast<int64_t>(ceil(bb.maxy / min_size)) - row);
+    int level = 0;
+    while ((int64_t(1) << level) < extent)
+    {
+        ++level;
+    }
+    auto candidates = vector<int>(ranges.size());
+    iota(candidates.begin(), candidates.end(), 0);
+    subdivide(column, row, level, 0, candidates);
+}
+
+QuadtreeTransformer::QuadtreeTransformer(double min_size) : min_size(min_size)
+{
+}
+
+void QuadtreeTransformer::transform_impl(const Roi &roi,
+                                         const Products &products,
+                                         IncidenceBuilder &builder,
+                                         const Ranges &ranges) const
+{
+    auto owner_sets = OwnerSets();
+    auto values = vector<double>();
+    int number_of_leaves = 0, number_of_boundary_leaves = 0;
+    visit_quadtree(roi, ranges, min_size, false, owner_sets,
+                   [&](const Polygon &cell, double size, uint32_t owners, const vector<int> &straddled) {
+                       // at the smallest size, the straddled ranges do not hold the cell
+                       number_of_boundary_leaves += straddled.empty() ? 0 : 1;
+                       if (owners != 0)
+                       {
+                           ++number_of_leaves;
+                           values.resize(owner_sets.size(), 0);
+                           values[owners] += size * size;
+                       }
+                   });
+
+    values.resize(owner_sets.size(), 0);
+    auto used = func::map(values, [](double value) { return value > 0; });
+    report["number_of_leaves"] = number_of_leaves;
+    report["number_of_boundary_leaves"] = number_of_boundary_leaves;
+    report["number_of_owner_sets"] = owner_sets.size();
+    add_owner_set_elements(owner_sets, values, used, builder);
+    add_imagery_cell(roi, builder);
+}
+
+HybridTransformer::HybridTransformer(double delta) : delta(delta)
+{
+}
+
+void HybridTransformer::transform_impl(const Roi &roi,
+                                       const Products &products,
+                                       IncidenceBuilder &builder,
+                                       const Ranges &ranges) const
+{
+    struct Piece
+    {
+        Polygon polygon;
+        uint32_t owners;
+    };
+
+    auto owner_sets = OwnerSets();
+    auto values = vector<double>();
+    int number_of_leaves = 0, number_of_boundary_leaves = 0, number_of_clips = 0;
+    auto pieces = vector<Piece>();
+    auto next_pieces = vector<Piece>();
+    auto inners = Polygons(); // clip buffers, reused by every clip
+    auto outers = Polygons();
+    visit_quadtree(roi, ranges, delta, true, owner_sets,
+                   [&](const Polygon &cell, double size, uint32_t owners, const vector<int> &straddled) {
+                       ++number_of_leaves;
+                       if (straddled.empty())
+                       {
+                           values.resize(owner_sets.size(), 0);
+                           values[owners] += size * size;
+                           return;
+                       }
+
+                       // a boundary cell is cut by the ranges it straddles, as ContinuousTransformer cuts its cells
+                       ++number_of_boundary_leaves;
+                       pieces.assign(1, Piece{cell, owners});
+                       for (auto range_id : straddled)
+                       {
+                           next_pieces.clear();
+                           for (auto &piece : pieces)
+                           {
+                               // no tolerance, the default one is relative to the range and would drop the slivers
+                               clip(piece.polygon, ranges[range_id].product->polygon, inners, outers, 0);
+                               ++number_of_clips;
+                               if (inners.empty())
+                               {
+                                   next_pieces.push_back(move(piece));
+                                   continue;
+                               }
+                               for (auto &outer : outers)
+                               {
+                                   next_pieces.push_back(Piece{move(outer), piece.owners});
+                               }
+                               auto union_owners = owner_sets.with(piece.owners, range_id);
+                               for (auto &inner : inners)
+                               {
+                                   next_pieces.push_back(Piece{move(inner), union_owners});
+                               }
+                           }
+                           swap(pieces, next_pieces);
+                       }
+                       values.resize(owner_sets.size(), 0);
+                       for (const auto &piece : pieces)
+                       {
+                           values[piece.owners] += area(piece.polygon); // the pieces held by no range stay uncovered
+                       }
+                   });
+
+    values.resize(owner_sets.size(), 0);
+    auto used = func::map(values, [](double value) { return value > 0; });
+    used[0] = false;
+    report["number_of_leaves"] = number_of_leaves;
+    report["number_of_boundary_leaves"] = number_of_boundary_leaves;
+    report["boundary_leaf_ratio"] = number_of_leaves > 0 ? double(number_of_boundary_leaves) / number_of_leaves : 0;
+    report["number_of_clips"] = number_of_clips;
+    report["number_of_owner_sets"] = owner_sets.size();
+    add_owner_set_elements(owner_sets, values, used, builder);
+    add_imagery_cell(roi, builder);
+}
+
+// the index-th term of the van der Corput sequence in the base
+static double radical_inverse(int index, int base)
+{
+    double ret = 0, digit = 1.0 / base;
+    for (; index > 0; index /= base, digit /= base)
+    {
+        ret += (index % base) * digit;
+    }
+    return ret;
+}
+
+SamplingTransformer::SamplingTransformer(int number_of_samples) : number_of_samples(number_of_samples)
+{
+    if (number_of_samples <= 0)
+    {
+        throw invalid_argument("the number of samples should be positive");
+    }
+}
+
+void SamplingTransformer::transform_impl(const Roi &roi,
+                                         const Products &products,
+                                         IncidenceBuilder &builder,
+                                         const Ranges &ranges) const
+{
+    // the points are sorted by x, so the points in the bounding box of a range are in a slice of them
+    auto bb = bounding_box(roi.polygon);
+    auto points = vector<Point>();
+    for (int i = 1; i <= number_of_samples; ++i) // the first term is 0 in every base, it is skipped
+    {
+        auto point = Point{bb.minx + radical_inverse(i, 2) * (bb.maxx - bb.minx),
+                           bb.miny + radical_inverse(i, 3) * (bb.maxy - bb.miny)};
+        if (!outside(point, roi.polygon))
+        {
+            points.push_back(point);
+        }
+    }
+    sort(points.begin(), points.end(), [](const Point &a, const Point &b) { return a.x < b.x; });
+    auto xs = func::map(points, [](const Point &point) { return point.x; });
+    auto ys = func::map(points, [](const Point &point) { return point.y; });
+
+    // the points of a slice are tested against the edges of the range one edge at a time, keeping for each point its
+    // smallest signed distance (times the edge length) to the inner side, a loop of plain arithmetic the compiler
+    // vectorizes. A point on an edge is inside
+    auto owner_sets = OwnerSets();
+    auto point_owners = vector<uint32_t>(points.size(), 0);
+    auto margins = vector<double>();
+    for (const auto &range : ranges)
+    {
+        const auto &polygon = range.product->polygon;
+        auto box = bounding_box(polygon);
+        int first = lower_bound(xs.begin(), xs.end(), box.minx) - xs.begin();
+        int last = upper_bound(xs.begin(), xs.end(), box.maxx) - xs.begin();
+        int n = last - first;
+        const double *x = xs.data() + first, *y = ys.data() + first;
+        margins.assign(n, numeric_limits<double>::max());
+        double *margin = margins.data();
+        double orientation = area(polygon) < 0 ? -1 : 1; // the inner side is the left side of a counter-clockwise polygon
+        auto s = polygon.back();
+        for (const auto &e : polygon)
+        {
+            double ux = (e.x - s.x) * orientation, uy = (e.y - s.y) * orientation, sx = s.x, sy = s.y;
+            for (int i = 0; i < n; ++i)
+            {
+                margin[i] = min(margin[i], ux * (y[i] - sy) - uy * (x[i] - sx));
+            }
+            s = e;
+        }
+        for (int i = 0; i < n; ++i)
+        {
+            if (margin[i] >= 0)
+            {
+                point_owners[first + i] = owner_sets.with(point_owners[first + i], range.id);
+            }
+        }
+    }
+
+    double weight = points.empty() ? 0 : area(roi.polygon) / points.size();
+    auto values = vector<double>(owner_sets.size(), 0);
+    auto used = vector<bool>(owner_sets.size(), false);
+    int number_of_covered_points = 0;
+    for (auto owners : point_owners)
+    {
+        values[owners] += weight;
+        used[owners] = true;
+        number_of_covered_points += owners != 0 ? 1 : 0;
+    }
+    used[0] = false; // the uncovered points are left to the imagery cell
+
+    // the Wilson score interval of a binomial proportion, which stays valid when all or none of the points are
+    // covered. It is conservative, a low discrepancy sequence converges faster than random points
+    double n = max<size_t>(points.size(), 1), z = 1.96;
+    double coverage = number_of_covered_points / n;
+    double center = (coverage + z * z / (2 * n)) / (1 + z * z / n);
+    double half_width = z / (1 + z * z / n) * sqrt(coverage * (1 - coverage) / n + z * z / (4 * n * n));
+    report["number_of_samples"] = points.size();
+    report["number_of_owner_sets"] = owner_sets.size();
+    report["coverage"] = coverage;
+    report["coverage_confidence_interval"] = {max(0.0, center - half_width), min(1.0, center + half_width)};
+    add_owner_set_elements(owner_sets, values, used, builder);
+    add_imagery_cell(roi, builder);
 }
 
 void ContinuousTransformer::transform_impl(const Roi &roi,
                                            const Products &products,
-                                           Universe &universe,
-                                           Ranges &ranges) const
+                                           IncidenceBuilder &builder,
+                                           const Ranges &ranges) const
 {
 
     struct Cell
     {
-        Polygon polygon;     // geometric shape of the cell
-        set<Range *> owners; // the rectangles that cover the cell
+        Polygon polygon; // geometric shape of the cell
+        uint32_t owners; // signature of the rectangles that cover the cell
     };
 
-    auto cells = list<Cell>(); // cells currently got
+    auto owner_sets = OwnerSets();
 
-    for (auto &range : ranges)
+    // cells currently got are kept in a grid keyed by their bounding boxes, so a range only clips the cells
+    // around it. A cell's id is its position in `cells`, ids grow in the order the cells are made, and a
+    // split cell leaves the grid. Visiting candidates by id keeps the order of a plain list of cells.
+    auto cells = vector<Cell>();
+    auto alive = vector<bool>();
+    double mean_range_area = func::mean(ranges, [](const Range &range) {
+        auto box = bounding_box(range.product->polygon);
+        return (box.maxx - box.minx) * (box.maxy - box.miny);
+    });
+    auto grid = GridIndex(bounding_box(roi.polygon), sqrt(mean_range_area));
+    auto add_cell = [&cells, &alive, &grid](Cell cell) {
+        grid.insert(cells.size(), bounding_box(cell.polygon));
+        cells.push_back(move(cell));
+        alive.push_back(true);
+    };
+
+    auto inners = Polygons(); // clip buffers, reused by every clip
+    auto outers = Polygons();
+    auto cutters = Polygons();
+    auto range_polygons = Polygons();
+    auto new_inner_cells = vector<Cell>();
+    auto new_outer_cells = vector<Cell>();
+    int cnt_clips = 0;
+
+    for (int range_id = 0; range_id < ranges.size(); ++range_id)
     {
+        const auto &range = ranges[range_id];
+
         // for example, currently we have cell 1 and 2
 
         // ------------
@@ -172,31 +744,29 @@ void ContinuousTransformer::transform_impl(const Roi &roi,
         // |     / 3' |      /
         // -----------------
 
-        auto new_inner_cells = list<Cell>();
-        auto new_outer_cells = list<Cell>();
-        for (auto it = cells.begin(); it != cells.end();)
+        new_inner_cells.clear();
+        new_outer_cells.clear();
+        for (auto id : grid.query(bounding_box(range.product->polygon)))
         {
-            auto inners = list<Polygon>();
-            auto outers = list<Polygon>();
-            tie(inners, outers) = clip(it->polygon, range.product->polygon);
+            auto &cell = cells[id];
+            clip(cell.polygon, range.product->polygon, inners, outers);
+            ++cnt_clips;
             if (inners.size() > 0) // the product intersects with the cell
             {
-                auto prev_owners = move(it->owners); // record the owner of the cell
-                it = cells.erase(it);                // discard the cell
-                for (auto outer : outers)
+                auto prev_owners = cell.owners; // record the owner of the cell
+                grid.remove(id);                // discard the cell
+                alive[id] = false;
+                cell.polygon = Polygon();
+                for (const auto &outer : outers)
                 {
                     new_outer_cells.push_back(Cell{outer, prev_owners});
                 }
-                prev_owners.insert(&range); // the inners are also covered by the product itself
-                for (auto inner : inners)
+                auto union_owners = owner_sets.with(prev_owners, range_id); // the inners are also covered by the product itself
+                for (const auto &inner : inners)
                 {
-                    new_inner_cells.push_back(Cell{inner, prev_owners});
+                    new_inner_cells.push_back(Cell{inner, union_owners});
                 }
             }
-            else
-            {
-                ++it;
-            }
         }
 
         // the following difference does this things:
@@ -218,19 +788,26 @@ void ContinuousTransformer::transform_impl(const Roi &roi,
         // |     / 3' |  4'  /
         // -----------------
 
-        auto range_polygons = difference({range.product->polygon},
-                                         func::map(new_inner_cells, // get all polygon of new inner cells
-                                                   [](const Cell &cell) {
-                                                       return cell.polygon;
-                                                   }));
+        cutters.clear(); // get all polygon of new inner cells
+        for (const auto &cell : new_inner_cells)
+        {
+            cutters.push_back(cell.polygon);
+        }
+        difference(range.product->polygon, cutters, range_polygons);
 
         for (const auto &range_polygon : range_polygons)
         {
-            new_outer_cells.push_back(Cell{range_polygon, {&range}});
+            new_outer_cells.push_back(Cell{range_polygon, owner_sets.with(0, range_id)});
         }
 
-        cells.splice(cells.end(), new_inner_cells);
-        cells.splice(cells.end(), new_outer_cells);
+        for (auto &cell : new_inner_cells)
+        {
+            add_cell(move(cell));
+        }
+        for (auto &cell : new_outer_cells)
+        {
+            add_cell(move(cell));
+        }
 
         // clear_online_plotter();
         // for (const auto &cell : cells)
@@ -241,30 +818,24 @@ void ContinuousTransformer::transform_impl(const Roi &roi,
     }
 
     // calculate the value (i.e. area) of each cell
-    auto value_map = map<set<Range *>, double>();
-    for (const auto &cell : cells)
+    auto values = vector<double>(owner_sets.size(), 0);
+    auto used = vector<bool>(owner_sets.size(), false);
+    for (int id = 0; id < cells.size(); ++id)
     {
-        if (value_map.count(cell.owners) == 0)
+        if (!alive[id])
         {
-            value_map[cell.owners] = 0;
+            continue;
         }
-        value_map[cell.owners] += area(cell.polygon);
+        const auto &cell = cells[id];
+        values[cell.owners] += area(cell.polygon);
+        used[cell.owners] = true;
     }
+    report["number_of_clips"] = cnt_clips;
+    report["number_of_owner_sets"] = owner_sets.size();
 
-    for (const auto &kv : value_map)
-    {
-        int cell_index = universe.elements.size();
-        // update universe
-        universe.elements.insert(Element{cell_index, kv.second});
-
-        // update ranges
-        for (auto range : kv.first)
-        {
-            range->elements.insert(Element{cell_index, kv.second});
-        }
-    }
+    add_owner_set_elements(owner_sets, values, used, builder);
 
-    add_imagery_cell(universe);
+    add_imagery_cell(roi, builder);
     // rectangles per cell
     // report["histogram"] = {};
     // for (const auto& kv: value_map)
@@ -280,30 +851,34 @@ void ContinuousTransformer::transform_impl(const Roi &roi,
 
 void FastContinuousTransformer::transform_impl(const Roi &roi,
                                                const Products &products,
-                                               Universe &universe,
-                                               Ranges &ranges) const
+                                               IncidenceBuilder &builder,
+                                               const Ranges &ranges) const
 {
     struct Cell;
 
     struct Node
     {
-        Range &range;
+        int range_id;
         const Polygon &polygon; // make reference easier, it is actually range.product->polygon
         list<Cell> cells;
-        set<int> neighboors;
+        vector<int> neighboors; // in ascending order
     };
 
     struct Cell
     {
-        Polygon polygon;     // geometric shape of the cell
-        set<Range *> owners; // owned by nodes
-        void clipped_by(const Node &node, list<Cell> &inners, list<Cell> &outers)
+        Polygon polygon; // geometric shape of the cell
+        uint32_t owners; // signature of the owning nodes
+        void clipped_by(const Node &node, OwnerSets &owner_sets, vector<Cell> &inners, vector<Cell> &outers)
         {
-            auto inner_polygons = list<Polygon>();
-            auto outer_polygons = list<Polygon>();
-            tie(inner_polygons, outer_polygons) = clip(polygon, node.polygon);
-            auto union_owners = owners;
-            union_owners.insert(&(node.range));
+            thread_local Polygons inner_polygons, outer_polygons; // reused between calls to avoid allocation
+            inners.clear();
+            outers.clear();
+            clip(polygon, node.polygon, inner_polygons, outer_polygons);
+            if (inner_polygons.size() == 0)
+            {
+                return;
+            }
+            auto union_owners = owner_sets.with(owners, node.range_id);
             for (const auto &inner_polygon : inner_polygons)
             {
                 inners.push_back(Cell{
@@ -321,34 +896,57 @@ void FastContinuousTransformer::transform_impl(const Roi &roi,
         }
     };
 
+    auto owner_sets = OwnerSets();
     auto nodes = vector<Node>();
     nodes.reserve(ranges.size());
 
-    for (auto &range : ranges)
+    for (int range_id = 0; range_id < ranges.size(); ++range_id)
     {
         auto node = Node{
-            range,
-            range.product->polygon,
+            range_id,
+            ranges[range_id].product->polygon,
         };
         nodes.push_back(node);
     }
 
     // calculate neighboors, after this is done, the neighboors will only be checked for only once.
+    // only the pairs sharing a bucket of a grid sized by the median scene are tested exactly
+    auto boxes = func::map(nodes, [](const Node &node) {
+        return bounding_box(node.polygon);
+    });
+    auto box_areas = func::map(boxes, [](const BoundingBox &box) {
+        return (box.maxx - box.minx) * (box.maxy - box.miny);
+    });
+    double median_area = 0;
+    if (box_areas.size() > 0)
+    {
+        nth_element(box_areas.begin(), box_areas.begin() + box_areas.size() / 2, box_areas.end());
+        median_area = box_areas[box_areas.size() / 2];
+    }
+    auto grid = GridIndex(boxes, sqrt(median_area));
+    int cnt_candidates = 0;
     int cnt_its = 0;
     for (int i = 0; i < nodes.size(); ++i)
     {
         auto &ni = nodes[i];
-        for (int j = i + 1; j < nodes.size(); ++j)
+        for (auto j : grid.query(boxes[i])) // ascending, so the neighboors are appended in order
         {
+            if (j <= i)
+            {
+                continue;
+            }
+            cnt_candidates++;
             auto &nj = nodes[j];
             if (intersects(ni.polygon, nj.polygon))
             {
-                ni.neighboors.insert(j);
-                nj.neighboors.insert(i);
+                ni.neighboors.push_back(j);
+                nj.neighboors.push_back(i);
                 cnt_its++;
             }
         }
     }
+    report["number_of_candidate_pairs"] = cnt_candidates;
+    report["number_of_neighboor_pairs"] = cnt_its;
 
     vector<bool> visited(nodes.size(), false);
 
@@ -365,10 +963,14 @@ void FastContinuousTransformer::transform_impl(const Roi &roi,
     //     // return cnt;
     // };
 
+    auto inners = vector<Cell>(); // clip buffers, reused by every clip
+    auto outers = vector<Cell>();
+    auto cutters = Polygons();
+    auto cut_parts = Polygons();
     for (int i = 0; i < nodes.size(); ++i)
     {
         auto &node = nodes[i];
-        auto cutters = list<Polygon>();
+        cutters.clear();
         for (auto nid : node.neighboors)
         {
             if (visited[nid])
@@ -378,9 +980,7 @@ void FastContinuousTransformer::transform_impl(const Roi &roi,
                 for (auto cit = neighboor_node.cells.begin();
                      cit != neighboor_node.cells.end();)
                 {
-                    auto inners = list<Cell>();
-                    auto outers = list<Cell>();
-                    cit->clipped_by(node, inners, outers);
+                    cit->clipped_by(node, owner_sets, inners, outers);
                     if (inners.size() > 0) // there are intersection!
                     {
                         if (true)
@@ -414,12 +1014,12 @@ void FastContinuousTransformer::transform_impl(const Roi &roi,
                                             new_cells_for_neighboor.end());
             }
         }
-        auto cut_parts = difference({node.polygon}, cutters);
+        difference(node.polygon, cutters, cut_parts);
         for (const auto &cut_part : cut_parts)
         {
             node.cells.push_back(Cell{
                 cut_part,
-                {&node.range},
+                owner_sets.with(0, node.range_id),
             });
         }
         visited[i] = true;
@@ -509,37 +1109,22 @@ void FastContinuousTransformer::transform_impl(const Roi &roi,
     }
     #endif 
     
-    auto cells = list<Cell>();
-    for (const auto &node : nodes)
-    {
-        cells.insert(cells.end(), node.cells.begin(), node.cells.end());
-    }
-
     // calculate the value (i.e. area) of each cell
-    auto value_map = map<set<Range *>, double>();
-    for (const auto &cell : cells)
+    auto values = vector<double>(owner_sets.size(), 0);
+    auto used = vector<bool>(owner_sets.size(), false);
+    for (const auto &node : nodes)
     {
-        if (value_map.count(cell.owners) == 0)
+        for (const auto &cell : node.cells)
         {
-            value_map[cell.owners] = 0;
+            values[cell.owners] += area(cell.polygon);
+            used[cell.owners] = true;
         }
-        value_map[cell.owners] += area(cell.polygon);
     }
+    report["number_of_owner_sets"] = owner_sets.size();
 
-    for (const auto &kv : value_map)
-    {
-        int cell_index = universe.elements.size();
-        // update universe
-        universe.elements.insert(Element{cell_index, kv.second});
-
-        // update ranges
-        for (auto range : kv.first)
-        {
-            range->elements.insert(Element{cell_index, kv.second});
-        }
-    }
+    add_owner_set_elements(owner_sets, values, used, builder);
 
-    add_imagery_cell(universe);
+    add_imagery_cell(roi, builder);
 }
 
 // auto range_id = map<Range *, int>();
@@ -1,7 +1,11 @@
 #ifndef CGSC_TRANSFORMER_H
 #define CGSC_TRANSFORMER_H
 
+#include <cstdint>
+#include <unordered_set>
+
 #include "model.h"
+#include "raster_cache.h"
 
 class Transformer
 {
@@ -14,13 +18,13 @@ public:
   virtual ~Transformer();
 
 protected:
-  void add_imagery_cell(Universe &universe) const;
+  void add_imagery_cell(const Roi &roi, IncidenceBuilder &builder) const;
 
 private:
   virtual void transform_impl(const Roi &roi,
                               const Products &products,
-                              Universe &universe,
-                              Ranges &ranges) const = 0;
+                              IncidenceBuilder &builder,
+                              const Ranges &ranges) const = 0;
 
 protected:
   mutable nlohmann::json report;
@@ -34,29 +38,89 @@ public:
 private:
   void transform_impl(const Roi &roi,
                       const Products &products,
-                      Universe &universe,
-                      Ranges &ranges) const;
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
 };
 
 class DiscreteTransformer : public Transformer
 {
 public:
-  DiscreteTransformer(double delta);
+  // with a cache, the cells of the whole products are kept from a roi to another and cropped to the cells of the roi
+  DiscreteTransformer(double delta, std::shared_ptr<RasterCache> cache = nullptr);
   std::string tag() const { return "discrete"; }
+  // cells of the grid whose four corners are not outside the polygon, which should be convex
+  std::unordered_set<uint64_t> discretize(const Polygon &polygon) const;
+  uint64_t unique_index(const Point &lower_left) const; // Morton key of the cell, nearby cells get nearby keys
+
+private:
+  void transform_impl(const Roi &roi,
+                      const Products &products,
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
+
+private:
+  double delta;
+  std::shared_ptr<RasterCache> cache;
+};
+
+// Cells of a quadtree over the roi, aligned with the grid of DiscreteTransformer at delta min_size. A cell is split
+// only while it straddles the boundary of a range, down to min_size, so the cells inside or outside all the ranges
+// stay coarse. The leaves have the ranges of the discrete cells they hold, and are valued by their areas.
+class QuadtreeTransformer : public Transformer
+{
+public:
+  QuadtreeTransformer(double min_size);
+  std::string tag() const { return "quadtree"; }
+
+private:
+  void transform_impl(const Roi &roi,
+                      const Products &products,
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
+
+private:
+  double min_size;
+};
+
+// The cells of QuadtreeTransformer at delta that are strictly inside or outside every range are kept whole, the
+// cells straddling the boundary of a range are cut by the ranges they straddle into exact pieces. The areas are those
+// of the pieces ContinuousTransformer makes, but only the thin band of boundary cells is clipped.
+class HybridTransformer : public Transformer
+{
+public:
+  HybridTransformer(double delta);
+  std::string tag() const { return "hybrid"; }
 
 private:
   void transform_impl(const Roi &roi,
                       const Products &products,
-                      Universe &universe,
-                      Ranges &ranges) const;
-  std::unordered_set<int> discretize(const Polygon &polygon,
-                                     std::function<bool(const Polygon &)>) const;
-  int unique_index(const Polygon &grid_cell) const;
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
 
 private:
   double delta;
 };
 
+// The roi is sampled by the first points of the Halton sequence (bases 2 and 3) over its bounding box that fall
+// inside it. Each point is an element of area(roi) / number of points, held by the ranges it is inside of, and the
+// points held by the same ranges are coalesced. The cost does not depend on how the ranges overlap, only on the number
+// of samples, and the coverage of the union of the ranges is reported with its 95% confidence interval.
+class SamplingTransformer : public Transformer
+{
+public:
+  SamplingTransformer(int number_of_samples);
+  std::string tag() const { return "sampling"; }
+
+private:
+  void transform_impl(const Roi &roi,
+                      const Products &products,
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
+
+private:
+  int number_of_samples;
+};
+
 class ContinuousTransformer : public Transformer
 {
 public:
@@ -65,8 +129,8 @@ public:
 private:
   void transform_impl(const Roi &roi,
                       const Products &products,
-                      Universe &universe,
-                      Ranges &ranges) const;
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
 };
 
 class FastContinuousTransformer : public Transformer
@@ -77,8 +141,8 @@ public:
 private:
   void transform_impl(const Roi &roi,
                       const Products &products,
-                      Universe &universe,
-                      Ranges &ranges) const;
+                      IncidenceBuilder &builder,
+                      const Ranges &ranges) const;
 };
 
 #endif
\ No newline at end of file
@@ -0,0 +1,140 @@
+// Checks DiscreteTransformer::discretize, which finds the cells row by row, against the per-cell rule it replaced:
+// a cell is in when none of its four corners is outside the polygon. Also checks that unique_index gives a cell the
+// same key whatever the rounding of its corner.
+
+#include <algorithm>
+#include <cmath>
+#include <iostream>
+#include <random>
+
+#include "transformer.h"
+
+using namespace std;
+
+namespace
+{
+int number_of_failures = 0;
+
+// the cells whose four corners are not outside the polygon, stepped over its bounding box one at a time
+unordered_set<uint64_t> cells_by_corners(const DiscreteTransformer &transformer, double delta, const Polygon &polygon)
+{
+    auto bb = bounding_box(polygon);
+    double minx = floor(bb.minx / delta) * delta;
+    double miny = floor(bb.miny / delta) * delta;
+    double maxx = ceil(bb.maxx / delta) * delta;
+    double maxy = ceil(bb.maxy / delta) * delta;
+    auto ret = unordered_set<uint64_t>();
+    for (double x = minx; x < maxx; x += delta)
+    {
+        for (double y = miny; y < maxy; y += delta)
+        {
+            auto cell = box({x, y}, {x + delta, y + delta});
+            if (all_of(cell.begin(), cell.end(), [&polygon](const Point &p) { return !outside(p, polygon); }))
+            {
+                ret.insert(transformer.unique_index(cell.front()));
+            }
+        }
+    }
+    return ret;
+}
+
+void check(const string &name, double delta, const Polygon &polygon)
+{
+    auto transformer = DiscreteTransformer(delta);
+    auto expected = cells_by_corners(transformer, delta, polygon);
+    auto actual = transformer.discretize(polygon);
+    if (actual != expected)
+    {
+        ++number_of_failures;
+        cerr << name << " at delta " << delta << ": " << actual.size() << " cells instead of " << expected.size()
+             << endl;
+    }
+}
+
+// the corners stepped by delta from several origins, the way discretize steps them, drift away from the multiples of
+// delta, their cells should still get the keys of the exact corners, distinct from each other
+void check_unique_index(double delta)
+{
+    auto transformer = DiscreteTransformer(delta);
+    for (int first_column : {-1000, -3, 0, 7, 1000})
+    {
+        auto keys = unordered_set<uint64_t>();
+        int row = first_column / 2;
+        double x = first_column * delta;
+        for (int column = first_column; column < first_column + 2000; ++column, x += delta)
+        {
+            auto key = transformer.unique_index({x, row * delta});
+            keys.insert(key);
+            if (key != transformer.unique_index({column * delta, row * delta}))
+            {
+                ++number_of_failures;
+                cerr << "the cell " << column << ", " << row << " at delta " << delta
+                     << " got another key from the corner " << x << endl;
+                return;
+            }
+        }
+        if (keys.size() != 2000)
+        {
+            ++number_of_failures;
+            cerr << "2000 cells got " << keys.size() << " keys at delta " << delta << endl;
+        }
+    }
+}
+
+// the rectangle of the given size centred at center, rotated counter-clockwise by angle
+Polygon rotated_rectangle(const Point &center, double width, double height, double angle)
+{
+    auto polygon = Polygon();
+    for (const auto &corner : box({-width / 2, -height / 2}, {width / 2, height / 2}))
+    {
+        polygon.push_back({center.x + corner.x * cos(angle) - corner.y * sin(angle),
+                           center.y + corner.x * sin(angle) + corner.y * cos(angle)});
+    }
+    return polygon;
+}
+} // namespace
+
+int main()
+{
+    auto rng = mt19937(7);
+    auto uniform = uniform_real_distribution<double>(0, 1);
+    for (double delta : {0.01, 0.0137, 0.05})
+    {
+        check_unique_index(delta);
+
+        // axis-aligned, with sides on the grid lines, and between them
+        check("grid-aligned rectangle", delta, box({0, 0}, {20 * delta, 10 * delta}));
+        check("shifted grid-aligned rectangle", delta, box({-7 * delta, 3 * delta}, {5 * delta, 11 * delta}));
+        for (int i = 0; i < 50; ++i)
+        {
+            double x = uniform(rng), y = uniform(rng);
+            check("axis-aligned rectangle", delta, box({x, y}, {x + 0.3 * uniform(rng), y + 0.3 * uniform(rng)}));
+        }
+
+        // rotated, from nearly level sides, whose corners sit on a row within the tolerance of outside(), to steep ones
+        for (double angle : {1e-12, 1e-9, 1e-6, 1e-3, 0.1, 0.5, M_PI / 4, 1.2, M_PI / 2 - 1e-9})
+        {
+            check("rotated rectangle", delta, rotated_rectangle({0.5, 0.5}, 0.2, 0.1, angle));
+            check("rotated grid-centred rectangle", delta, rotated_rectangle({0, 0}, 20 * delta, 10 * delta, angle));
+        }
+        for (int i = 0; i < 200; ++i)
+        {
+            auto center = Point{uniform(rng), uniform(rng)};
+            check("rotated rectangle", delta,
+                  rotated_rectangle(center, 0.05 + 0.3 * uniform(rng), 0.05 + 0.3 * uniform(rng), M_PI * uniform(rng)));
+        }
+
+        // triangles, and a polygon smaller than a cell
+        check("triangle", delta, Polygon{{0, 0}, {0.3, 0.01}, {0.1, 0.25}});
+        check("level-based triangle", delta, Polygon{{0, 5 * delta}, {0.3, 5 * delta}, {0.1, 0.25}});
+        check("tiny square", delta, box({0.1 + delta / 4, 0.1 + delta / 4}, {0.1 + delta / 2, 0.1 + delta / 2}));
+    }
+
+    if (number_of_failures > 0)
+    {
+        cerr << number_of_failures << " checks failed" << endl;
+        return 1;
+    }
+    cout << "discretize: all passed" << endl;
+    return 0;
+}
@@ -0,0 +1,115 @@
+// Checks that HybridTransformer, which clips only the quadtree cells straddling the boundary of a range, keeps the
+// areas exact at any delta: each range is worth its own area, and the uncovered share of the roi is the one
+// ContinuousTransformer finds, on random rectangles cropped to the roi the way Solver crops the products. The
+// clipping snaps the points within 1e-5 of a clipping line onto it, which moves the areas by about 1e-7.
+
+#include <cmath>
+#include <iostream>
+#include <random>
+
+#include "transformer.h"
+
+using namespace std;
+
+namespace
+{
+int number_of_failures = 0;
+int number_of_unchecked_unions = 0;
+
+// the rectangle of the given size centred at center, rotated counter-clockwise by angle
+Polygon rotated_rectangle(const Point &center, double width, double height, double angle)
+{
+    auto polygon = Polygon();
+    for (const auto &corner : box({-width / 2, -height / 2}, {width / 2, height / 2}))
+    {
+        polygon.push_back({center.x + corner.x * cos(angle) - corner.y * sin(angle),
+                           center.y + corner.x * sin(angle) + corner.y * cos(angle)});
+    }
+    return polygon;
+}
+
+// random rotated rectangles cropped to the roi, those missing it are left out
+Products cropped_products(const Roi &roi, int number_of_products, mt19937 &rng)
+{
+    auto uniform = uniform_real_distribution<double>(0, 1);
+    auto products = Products();
+    for (int i = 0; i < number_of_products; ++i)
+    {
+        auto center = Point{uniform(rng), uniform(rng)};
+        auto polygon =
+            rotated_rectangle(center, 0.1 + 0.4 * uniform(rng), 0.1 + 0.4 * uniform(rng), M_PI * uniform(rng));
+        auto inners = intersection(polygon, roi.polygon);
+        if (!inners.empty())
+        {
+            products.emplace_back(inners.front(), 1, i);
+        }
+    }
+    return products;
+}
+
+// true when every range is worth its own area, within the tolerance
+bool exact_ranges(const string &name, double delta, const Ranges &ranges, double tolerance, bool verbose)
+{
+    bool ret = true;
+    for (const auto &range : ranges)
+    {
+        if (abs(range.value - area(range.product->polygon)) > tolerance)
+        {
+            ret = false;
+            if (verbose)
+            {
+                cerr << name << " at delta " << delta << ": range " << range.id << " is worth " << range.value
+                     << " instead of its area " << area(range.product->polygon) << endl;
+            }
+        }
+    }
+    return ret;
+}
+
+void check(const string &name, double delta, const Roi &roi, const Products &products)
+{
+    auto universe = Universe(), expected_universe = Universe();
+    auto ranges = Ranges(), expected_ranges = Ranges();
+    auto report = HybridTransformer(delta).transform(roi, products, universe, ranges);
+    auto expected_report = ContinuousTransformer().transform(roi, products, expected_universe, expected_ranges);
+
+    double tolerance = 1e-6 * area(roi.polygon);
+    if (!exact_ranges(name, delta, ranges, tolerance, true))
+    {
+        ++number_of_failures;
+    }
+    if (!exact_ranges(name, delta, expected_ranges, tolerance, false))
+    {
+        ++number_of_unchecked_unions; // ContinuousTransformer may count a piece twice, it is no reference then
+        return;
+    }
+    double uncovered = report["uncovered_percentage"], expected_uncovered = expected_report["uncovered_percentage"];
+    if (abs(uncovered - expected_uncovered) * area(roi.polygon) > tolerance)
+    {
+        ++number_of_failures;
+        cerr << name << " at delta " << delta << ": " << uncovered << " of the roi uncovered instead of "
+             << expected_uncovered << endl;
+    }
+}
+} // namespace
+
+int main()
+{
+    auto rng = mt19937(11);
+    auto roi = Roi(box({0.1, 0.1}, {0.9, 0.9}));
+    for (double delta : {0.01, 0.002, 0.001, 0.0005})
+    {
+        for (int i = 0; i < 5; ++i)
+        {
+            check("cropped rectangles", delta, roi, cropped_products(roi, 12, rng));
+        }
+    }
+
+    if (number_of_failures > 0)
+    {
+        cerr << number_of_failures << " checks failed" << endl;
+        return 1;
+    }
+    cout << "hybrid: all passed, " << number_of_unchecked_unions << " unions left unchecked" << endl;
+    return 0;
+}